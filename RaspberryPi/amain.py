@@ -1,9 +1,9 @@
 # main.py
 import threading
-import time
 import fetch_images 
 import fetch  
-import encode_recognition_rpi
+import enrollment
+from utils.temp_storage import start_replayer, journal
 
 def fetch_image():
     fetch_images.main()
@@ -11,26 +11,86 @@ def fetch_image():
 def run_flask():
     fetch.run_server()
 
-fetch_image();
+# Attendance is written to MongoDB in the background while the next session
+# already runs; the outcome shows up in the session's status
+attendance_sessions = {}  # attendance key -> id of the session that recorded it
+attendance_lock = threading.Lock()
 
+def track_persistence(key, session_id):
+    """Reports the write of a session's journaled attendance in its status."""
+    with attendance_lock:
+        if journal.status(key) == "sent":
+            fetch.update_session(session_id, persistence="saved", persistError=None)
+        else:
+            attendance_sessions[key] = session_id
+            fetch.update_session(session_id, persistence="pending")
 
-server_thread2 = threading.Thread(target=run_flask)
-server_thread2.daemon = True
-server_thread2.start()
+def report_write(key, error):
+    with attendance_lock:
+        session_id = attendance_sessions.get(key)
+        if session_id is None:
+            return
+        if error is None:
+            # An older payload of the same key went through; the one merged
+            # with this session is still waiting and gets its own write
+            if journal.status(key) != "sent":
+                return
+            attendance_sessions.pop(key, None)
+            fetch.update_session(session_id, persistence="saved", persistError=None)
+        else:
+            fetch.update_session(session_id, persistence="retrying", persistError=str(error))
 
+def main():
+    # Imported here: it opens the camera and starts the recognition workers,
+    # which enrollment worker processes, importing this file, must not do
+    import encode_recognition_rpi
 
-print("Server started, waiting for data...")
+    fetch_image()
 
+    # Also writes sessions that were journaled while MongoDB was unreachable
+    start_replayer().add_listener(report_write)
 
-while True:
-    data = fetch.get_data()
-    if data:
+    # Enroll new photos in the background while waiting for a session
+    enrollment.start_background_enrollment()
+
+    # Load the galleries once, they stay hot for every session (the pipeline
+    # workers load the models when they start)
+    for division in enrollment.list_divisions():
+        encode_recognition_rpi.galleries.get(division)
+
+
+    server_thread2 = threading.Thread(target=run_flask)
+    server_thread2.daemon = True
+    server_thread2.start()
+
+
+    print("Server started, waiting for data...")
+
+    # Serve sessions back to back as soon as they are submitted
+    while True:
+        session_id, data = fetch.next_session()
         print("Data received in main file:", data)
-        #server_thread2.stop()
-        #server_thread2.daemon = False
-        break
-    time.sleep(1)
+        print(f"Processing session {session_id}...")
+        fetch.update_session(session_id, status="running")
+        key = None
+        journaled = None
+        try:
+            key = encode_recognition_rpi.attendance_key(data)
+            fetch.update_session(session_id, attendanceKey=key)
+            journaled = encode_recognition_rpi.handle_data(data)
+            fetch.update_session(session_id, status="done")
+        except Exception as e:
+            print(f"❌ Session {session_id} failed: {e}")
+            fetch.update_session(session_id, status="failed", error=str(e))
+            # It may still have journaled what it recognized before the error
+            if key is not None and journal.status(key) == "pending":
+                journaled = key
+        # Only tracked once journaled, so a write of an older payload of the same
+        # key cannot be mistaken for this session's
+        if journaled is not None:
+            track_persistence(journaled, session_id)
+        print("Session finished, waiting for data...")
 
-print("Processing the received data...")
 
-encode_recognition_rpi.handle_data(data)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Offline benchmark for the recognition pipeline.
+
+Replays recorded classroom videos and photo sets through the same
+preprocess -> detect -> encode -> match path as the live recognizer
+(recognition.process_frame) and reports throughput, per-stage latency
+percentiles, peak memory and recognition precision/recall. Results are
+saved as JSON so runs can be compared against each other.
+
+    python benchmark.py --division B --video checkdata/vid1.mp4 \\
+        --photos checkdata/photos --truth checkdata/truth.json \\
+        --baseline bench_results/previous.json
+
+The ground truth file maps every input (video or photo file name) to the
+people that appear in it:
+
+    {"vid1.mp4": ["U23CS107", "U23CS113"], "img9.jpeg": ["U23CS104"]}
+
+Pass --detect-scale several times to compare detection scales; every scale
+gets its own report and a speed/recall table is printed at the end:
+
+    python benchmark.py --division B --video checkdata/vid1.mp4 \
+        --truth checkdata/truth.json --detect-scale 1 --detect-scale 0.5 --detect-scale 0.25
+
+With --pipeline, --lores 320x240 detects on a luma image derived from every
+frame the way a dual-stream camera delivers it (see CAMERA_LORES_RESOLUTION)
+instead of on the downscaled main frame.
+"""
+import os
+import json
+import time
+import resource
+import argparse
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from config import DETECT_SCALE, TRACK_FACES, PREPROCESS_PROFILE
+from utils.preprocess import PROFILES
+from recognition import process_frame, match_faces, stage_seconds
+from pipeline import FramePipeline, Voter
+from utils.matcher import FaceMatcher
+from utils.tracker import FaceTracker
+from utils.scheduler import FrameScheduler
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png")
+RESULTS_PATH = "./bench_results"
+
+
+def latency_summary(samples):
+    """Summarizes a list of durations in seconds as milliseconds."""
+    if not samples:
+        return None
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def _collect(pipeline, matcher, timings, voter, timeout, expected=None, scheduler=None):
+    """
+    Matches pipeline results until none arrives within timeout, or until
+    expected results have arrived. Returns (frames, faces).
+    """
+    frames = faces = 0
+    while expected is None or frames < expected:
+        result = pipeline.get_result(timeout=timeout)
+        if result is None:
+            break
+        if scheduler is not None:
+            scheduler.record(stage_seconds(result.timings))
+        for stage, samples in result.timings.items():
+            timings.setdefault(stage, []).extend(samples)
+        matches = match_faces(matcher, result.face_encodings, timings)
+        pipeline.review(result, matches)
+        voter.update(matches, result.fresh)
+        frames += 1
+        faces += len(result.face_locations)
+    return frames, faces
+
+
+def max_frame_shape(videos):
+    """Largest (height, width, 3) among the videos, so one frame ring fits them all."""
+    height = width = 0
+    for path in videos:
+        video_capture = cv2.VideoCapture(path)
+        height = max(height, int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        width = max(width, int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)))
+        video_capture.release()
+    return (height, width, 3) if height and width else None
+
+
+def parse_resolution(value):
+    """Parses "WxH" into a (width, height) tuple."""
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WxH, got {value!r}")
+    return width, height
+
+
+def replay_video(path, matcher, timings, every=5, confirm=10, max_frames=None, pipeline=None, detect_scale=None,
+                 track=False, profile=None, lores=None):
+    """
+    Returns (frames processed, faces found, names confirmed) for one video.
+
+    With a pipeline, frames go through the multi-process FramePipeline
+    instead, including any frames it drops when it falls behind. With track,
+    faces are tracked across frames in video time and only re-encoded when
+    the tracker asks for it. every=0 picks frames with the FrameScheduler,
+    in video time, like the live loop. With lores, every frame is submitted
+    with its (width, height) luma image like a FakeCameraSource would.
+    """
+    video_capture = cv2.VideoCapture(path)
+    if not video_capture.isOpened():
+        print(f"❌ Failed to load video from {path}.")
+        return 0, 0, set()
+
+    framecount = 0
+    processed = 0
+    submitted = 0
+    faces = 0
+    # Confirms people by the same rule as the live loop
+    voter = Voter(confirm_frames=confirm, verbose=False)
+    tracker = FaceTracker() if track and pipeline is None else None
+    scheduler = None
+    if not every:
+        workers = pipeline.detect_workers + pipeline.encode_workers if pipeline is not None else 1
+        scheduler = FrameScheduler(workers=workers)
+
+    while True:
+        start = time.perf_counter()
+        ret, frame = video_capture.read()
+        timings.setdefault("decode", []).append(time.perf_counter() - start)
+        if not ret:
+            break
+
+        position = video_capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if scheduler.should_process(frame, position) if scheduler is not None else framecount % every == 0:
+            if pipeline is not None:
+                luma = None
+                if lores is not None:
+                    luma = cv2.cvtColor(cv2.resize(frame, lores, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+                pipeline.submit(frame, block=True, luma=luma)
+                submitted += 1
+                n_frames, n_faces = _collect(pipeline, matcher, timings, voter, 0, scheduler=scheduler)
+                processed += n_frames
+                faces += n_faces
+            else:
+                start = time.perf_counter()
+                face_locations, matches, fresh = process_frame(frame, matcher, timings, detect_scale, tracker, position,
+                                                               profile)
+                if scheduler is not None:
+                    scheduler.record(time.perf_counter() - start)
+                processed += 1
+                faces += len(face_locations)
+                voter.update(matches, fresh)
+
+            if max_frames and processed >= max_frames:
+                break
+        framecount += 1
+
+    if pipeline is not None:
+        n_frames, n_faces = _collect(pipeline, matcher, timings, voter, 2 * pipeline.max_frame_age,
+                                     expected=submitted - processed)
+        processed += n_frames
+        faces += n_faces
+
+    video_capture.release()
+    return processed, faces, voter.confirmed
+
+
+def replay_photo(path, matcher, timings, detect_scale=None, profile=None):
+    """Returns (frames processed, faces found, names recognized) for one photo."""
+    start = time.perf_counter()
+    frame = cv2.imread(path)
+    timings.setdefault("decode", []).append(time.perf_counter() - start)
+    if frame is None:
+        print(f"❌ Failed to load image from {path}.")
+        return 0, 0, set()
+
+    face_locations, matches, _ = process_frame(frame, matcher, timings, detect_scale, profile=profile)
+    recognized = {match.name for match in matches if match.name != "Unknown"}
+    return 1, len(face_locations), recognized
+
+
+def list_inputs(videos, photo_dirs):
+    inputs = [("video", path) for path in videos]
+    for photo_dir in photo_dirs:
+        for name in sorted(os.listdir(photo_dir)):
+            if name.lower().endswith(PHOTO_EXTENSIONS):
+                inputs.append(("photo", os.path.join(photo_dir, name)))
+    return inputs
+
+
+def score(expected, predicted):
+    tp = len(expected & predicted)
+    return tp, len(predicted - expected), len(expected - predicted)
+
+
+def run_benchmark(division, videos=(), photo_dirs=(), truth=None, every=5, confirm=10, max_frames=None,
+                  use_pipeline=False, detect_scale=None, track=None, profile=None, lores=None):
+    """Replays every input and returns the report as a dict."""
+    truth = truth or {}
+    detect_scale = detect_scale or DETECT_SCALE
+    track = TRACK_FACES if track is None else track
+    profile = profile or PREPROCESS_PROFILE
+    lores = tuple(lores) if use_pipeline and lores else None  # only the pipeline detects on a luma stream
+    load_start = time.perf_counter()
+    matcher = FaceMatcher.from_division(division)
+    load_seconds = time.perf_counter() - load_start
+
+    pipeline = None
+    if use_pipeline:
+        pipeline = FramePipeline(frame_shape=max_frame_shape(videos), detect_scale=detect_scale, track=track,
+                                 profile=profile, luma_shape=lores and (lores[1], lores[0])).start()
+
+    timings = {}
+    results = []
+    totals = {"tp": 0, "fp": 0, "fn": 0}
+    frames = 0
+    faces = 0
+
+    wall_start = time.perf_counter()
+    for kind, path in list_inputs(videos, photo_dirs):
+        print(f"▶️ Replaying {kind} {path}")
+        if kind == "video":
+            n_frames, n_faces, predicted = replay_video(path, matcher, timings, every, confirm, max_frames, pipeline,
+                                                        detect_scale, track, profile, lores)
+        else:
+            n_frames, n_faces, predicted = replay_photo(path, matcher, timings, detect_scale, profile)
+        frames += n_frames
+        faces += n_faces
+
+        result = {"input": os.path.basename(path), "kind": kind, "frames": n_frames,
+                  "faces": n_faces, "predicted": sorted(predicted)}
+        expected = truth.get(os.path.basename(path))
+        if expected is not None:
+            tp, fp, fn = score(set(expected), predicted)
+            result.update(truth=sorted(expected), tp=tp, fp=fp, fn=fn)
+            totals["tp"] += tp
+            totals["fp"] += fp
+            totals["fn"] += fn
+        results.append(result)
+    wall_seconds = time.perf_counter() - wall_start
+
+    dropped = 0
+    if pipeline is not None:
+        dropped = pipeline.dropped
+        pipeline.stop()
+
+    # Stage time per frame; with the pipeline, wall time is what counts
+    pipeline_seconds = wall_seconds if use_pipeline else stage_seconds(timings)
+    tp, fp, fn = totals["tp"], totals["fp"], totals["fn"]
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {"division": division, "every": every, "confirm": confirm,
+                   "max_frames": max_frames, "gallery_size": len(matcher), "pipeline": use_pipeline,
+                   "detect_scale": detect_scale, "track": track,
+                   "preprocess": profile, "lores": list(lores) if lores else None},
+        "frames": frames,
+        "dropped_frames": dropped,
+        "faces": faces,
+        "encoder_calls": len(timings.get("encode", [])),
+        "gallery_load_ms": load_seconds * 1000,
+        "wall_seconds": wall_seconds,
+        "fps": frames / pipeline_seconds if pipeline_seconds else 0.0,
+        "wall_fps": frames / wall_seconds if wall_seconds else 0.0,
+        "stages": {stage: latency_summary(samples) for stage, samples in timings.items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_workers_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "accuracy": {
+            **totals,
+            "precision": tp / (tp + fp) if tp + fp else None,
+            "recall": tp / (tp + fn) if tp + fn else None,
+        },
+        "inputs": results,
+    }
+
+
+def _ratio(value):
+    return "n/a" if value is None else f"{value:.3f}"
+
+
+def print_report(report, baseline=None):
+    def delta(new, old, fmt="{:+.1f}"):
+        if baseline is None or new is None or old is None:
+            return ""
+        return f" ({fmt.format(new - old)})"
+
+    old = baseline or {}
+    print(f"🎞️ {report['frames']} frames, {report['faces']} faces, {report['dropped_frames']} dropped, "
+          f"{report.get('encoder_calls', 0)} encoder calls{delta(report.get('encoder_calls'), old.get('encoder_calls'), '{:+d}')}")
+    print(f"⚡ {report['fps']:.2f} FPS pipeline{delta(report['fps'], old.get('fps'), '{:+.2f}')}, "
+          f"{report['wall_fps']:.2f} FPS wall")
+    for stage, summary in report["stages"].items():
+        if summary is None:
+            continue
+        old_summary = (old.get("stages") or {}).get(stage) or {}
+        print(f"   {stage:<10} p50 {summary['p50_ms']:8.1f} ms{delta(summary['p50_ms'], old_summary.get('p50_ms'))}"
+              f"  p90 {summary['p90_ms']:8.1f} ms  p99 {summary['p99_ms']:8.1f} ms")
+    print(f"🧠 Peak RSS {report['peak_rss_mb']:.0f} MB{delta(report['peak_rss_mb'], old.get('peak_rss_mb'))}")
+
+    accuracy = report["accuracy"]
+    old_accuracy = old.get("accuracy") or {}
+    if accuracy["precision"] is not None or accuracy["recall"] is not None:
+        print(f"🎯 Precision {_ratio(accuracy['precision'])}{delta(accuracy['precision'], old_accuracy.get('precision'), '{:+.3f}')}, "
+              f"recall {_ratio(accuracy['recall'])}{delta(accuracy['recall'], old_accuracy.get('recall'), '{:+.3f}')}")
+
+
+def print_tradeoff(reports):
+    """One line per detection scale: speed against recall."""
+    print("🔍 Detection scale trade-off")
+    print(f"   {'scale':>6} {'fps':>8} {'detect p50':>12} {'faces':>6} {'precision':>10} {'recall':>8}")
+    for report in reports:
+        detect = report["stages"].get("detect") or {}
+        accuracy = report["accuracy"]
+        print(f"   {report['config']['detect_scale']:>6g} {report['fps']:>8.2f} {detect.get('p50_ms', 0):>9.1f} ms "
+              f"{report['faces']:>6} {_ratio(accuracy['precision']):>10} {_ratio(accuracy['recall']):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the face recognition pipeline offline")
+    parser.add_argument("--division", required=True, help="Division whose gallery is matched against")
+    parser.add_argument("--video", action="append", default=[], help="Recorded classroom video (repeatable)")
+    parser.add_argument("--photos", action="append", default=[], help="Folder of classroom photos (repeatable)")
+    parser.add_argument("--truth", help="JSON file mapping input file names to the people present")
+    parser.add_argument("--every", type=int, default=5,
+                        help="Process every Nth video frame, 0 picks frames with the adaptive scheduler like the live loop")
+    parser.add_argument("--confirm", type=int, default=10, help="Freshly encoded matches that confirm a person in a video, as in the live loop")
+    parser.add_argument("--max-frames", type=int, help="Stop each video after this many processed frames")
+    parser.add_argument("--pipeline", action="store_true", help="Run frames through the multi-process FramePipeline")
+    parser.add_argument("--detect-scale", type=float, action="append", default=[],
+                        help=f"Resize frames by this before detection (repeatable, default {DETECT_SCALE})")
+    parser.add_argument("--lores", type=parse_resolution, metavar="WxH",
+                        help="With --pipeline, detect on a luma image of this size like a dual-stream camera")
+    parser.add_argument("--preprocess", choices=sorted(PROFILES), default=PREPROCESS_PROFILE,
+                        help="Preprocessing profile to run frames through")
+    parser.add_argument("--track", action=argparse.BooleanOptionalAction, default=TRACK_FACES,
+                        help="Track faces across video frames and reuse their encodings")
+    parser.add_argument("--out", help="Where to save the JSON report")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+    if args.lores and not args.pipeline:
+        parser.error("--lores needs --pipeline")
+
+    truth = None
+    if args.truth:
+        with open(args.truth, "r") as f:
+            truth = json.load(f)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    scales = args.detect_scale or [DETECT_SCALE]
+    out = args.out or os.path.join(RESULTS_PATH, f"{args.division}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+
+    reports = []
+    for scale in scales:
+        report = run_benchmark(args.division, args.video, args.photos, truth,
+                               every=args.every, confirm=args.confirm, max_frames=args.max_frames,
+                               use_pipeline=args.pipeline, detect_scale=scale,
+                               track=args.track, profile=args.preprocess, lores=args.lores)
+        print_report(report, baseline)
+        reports.append(report)
+
+        # One report per scale when comparing several
+        path = out if len(scales) == 1 else f"{os.path.splitext(out)[0]}_x{scale:g}.json"
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Saved benchmark results to {path}")
+
+    if len(reports) > 1:
+        print_tradeoff(reports)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,58 @@
 MONGO_URI = "<your mongodb uri>" #ex. mongodb+srv://<user name>:<mongo db link>/?retryWrites=true&w=majority&appName=<collection name> 
 DATABASE_NAME = "database name"
 COLLECTION_NAME = "<collection name>"
-COLLECTION_ENCODING = "<collection where encodings stored>"
\ No newline at end of file
+COLLECTION_ENCODING = "<collection where encodings stored>"
+SESSION_COLLECTION_NAME = "Sessions"  # one document per session with its present and absent students
+
+MONGO_MAX_POOL_SIZE = 4  # connections kept by the process-wide MongoClient
+MONGO_MIN_POOL_SIZE = 1  # connections kept open even while idle
+MONGO_MAX_IDLE_TIME_MS = 600000  # longer than a session, so the end-of-session write finds the connection warm
+MONGO_CONNECT_TIMEOUT_MS = 10000
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 10000
+
+JOURNAL_PATH = "attendance_journal.sqlite3"  # sessions are committed here first and replayed to MongoDB in the background
+JOURNAL_RETRY_SECONDS = 5  # first retry delay of a failed write, doubled on every further failure
+JOURNAL_MAX_RETRY_SECONDS = 300  # longest delay between two retries
+JOURNAL_FLUSH_TIMEOUT = 15  # seconds the process may wait at exit for journaled sessions to be written
+RECOGNITION_LOG_PATH = "recognized_faces.jsonl"  # append-only log of the running session's confirmed recognitions
+RECOGNITION_LOG_FSYNC_SECONDS = 2.0  # longest time confirmations stay buffered before they are fsynced
+
+ENROLL_WORKERS = 0  # processes used to encode faces, 0 uses every core and 1 encodes serially
+ENROLL_BUDGET = 900  # seconds a background enrollment run may spend before it checkpoints and stops, 0 for no limit
+ENROLL_CHECKPOINT = 25  # images encoded between two gallery checkpoints
+ENROLL_NICE = 10  # niceness added to enrollment worker processes
+
+DOWNLOAD_WORKERS = 8  # concurrent image downloads (and Firestore lookups) in fetch_images.py
+DOWNLOAD_TIMEOUT = (5, 30)  # connect, read timeout in seconds of one image request
+DOWNLOAD_RETRIES = 3  # retries of a failed image download
+DOWNLOAD_BACKOFF = 1.0  # seconds before the first retry, doubled for every further one
+
+GALLERY_CACHE_MB = 64  # memory the recognition service may use to keep division galleries loaded
+
+CAMERA_SOURCE = "picamera2"  # or a video file / OpenCV device index replayed as a fake camera (utils/camera.py)
+CAMERA_RESOLUTION = (640, 480)  # width, height of the main stream faces are encoded from
+CAMERA_LORES_RESOLUTION = (320, 240)  # width, height of the luma stream faces are detected on (replaces DETECT_SCALE), None for a single stream
+PREPROCESS_PROFILE = "default"  # preprocessing steps for the room's lighting: default, roi, bright, dim or color (utils/preprocess.py)
+DETECT_SCALE = 0.5  # frames are resized by this before HOG face detection (1, 0.5 or 0.25), encoding stays at full size
+
+PIPELINE_DETECT_WORKERS = 2  # processes running preprocess + HOG detection
+PIPELINE_ENCODE_WORKERS = 1  # processes running landmarking + the dlib encoder
+PIPELINE_QUEUE_SIZE = 2  # frames waiting between stages before the oldest is dropped
+PIPELINE_MAX_FRAME_AGE = 0.5  # seconds after which a waiting frame is stale and skipped
+FRAME_RING_SLOTS = 8  # camera frames kept in shared memory for the pipeline workers
+
+TRACK_FACES = True  # reuse the encoding of a face tracked across frames (needs a single encode worker)
+TRACK_IOU_THRESHOLD = 0.3  # box overlap needed to continue a track
+TRACK_MAX_MISSED = 3  # processed frames a track may go unseen before it is dropped
+TRACK_REENCODE_SECONDS = 2.0  # age after which a tracked face is encoded again
+TRACK_MIN_MARGIN = 0.05  # matches closer than this to the runner-up person are re-encoded next frame
+
+SCHED_CPU_BUDGET = 0.8  # share of the recognition workers' time frame processing may use
+SCHED_MOTION_THRESHOLD = 2.0  # mean gray level change (0-255) that counts as motion
+SCHED_MAX_INTERVAL = 1.0  # seconds after which even a static frame is processed
+SCHED_WINDOW = 20  # processed frames the rolling processing cost is averaged over
+
+PREVIEW_ENABLED = False  # serve an annotated MJPEG preview at GET /preview, the recognizer is headless either way
+PREVIEW_JPEG_QUALITY = 70
+PREVIEW_MAX_FPS = 5  # frames per second offered to the preview at most
+PREVIEW_NICE = 10  # niceness of the preview encoding thread
@@ -0,0 +1,100 @@
+"""
+Per-student, per-subject attendance counters kept next to the raw history.
+
+Every student document carries
+
+    stats.<semester>.<subject> = {"held": 40, "attended": 35, "last_seen": "2025-04-23"}
+
+which the Pi writer bumps with $inc/$max in the same update that pushes the
+session's attendance entry, so both change together or not at all. Reports
+read these counters instead of walking the history arrays; the session
+documents (database/sessions.py) carry the per-session totals.
+
+The counters can always be recomputed from the raw arrays:
+
+    python -m database.aggregates verify     # lists students whose counters differ
+    python -m database.aggregates rebuild    # overwrites stats from the raw arrays
+
+Run rebuild once after upgrading, so students with history from before the
+counters existed start from the right values.
+"""
+import argparse
+
+from pymongo import UpdateOne
+
+from database.database import get_collection
+
+REBUILD_BATCH = 500  # student documents per bulk write
+
+
+def stats_field(semester, subject):
+    return f"stats.{semester}.{subject}"
+
+
+def compute_stats(student):
+    """Recomputes the stats of one student document from its attendance arrays."""
+    stats = {}
+    for semester, subjects in (student.get("attendance") or {}).items():
+        if not isinstance(subjects, dict):
+            continue
+        for subject, entries in subjects.items():
+            counters = {"held": 0, "attended": 0}
+            for entry in entries or []:
+                counters["held"] += 1
+                if entry.get("status") == "present":
+                    counters["attended"] += 1
+                    date = entry.get("date")
+                    if date is not None and date > counters.get("last_seen", ""):
+                        counters["last_seen"] = date
+            stats.setdefault(semester, {})[subject] = counters
+    return stats
+
+
+def _students():
+    return get_collection().find({"attendance": {"$exists": True}}, {"attendance": 1, "stats": 1})
+
+
+def verify():
+    """Returns the ids of students whose stored counters differ from their raw history."""
+    mismatched = []
+    checked = 0
+    for student in _students():
+        checked += 1
+        if (student.get("stats") or {}) != compute_stats(student):
+            mismatched.append(student["_id"])
+            print(f"❌ {student['_id']}: counters differ from the attendance history")
+    print(f"🔎 Checked {checked} students, {len(mismatched)} mismatched.")
+    return mismatched
+
+
+def rebuild():
+    """Overwrites the stats of every student with the values recomputed from the raw history."""
+    collection = get_collection()
+    requests = []
+    written = 0
+    for student in _students():
+        requests.append(UpdateOne({"_id": student["_id"]}, {"$set": {"stats": compute_stats(student)}}))
+        if len(requests) == REBUILD_BATCH:
+            collection.bulk_write(requests, ordered=False)
+            written += len(requests)
+            requests = []
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+        written += len(requests)
+    print(f"💾 Rebuilt the counters of {written} students.")
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check or rebuild the per-student attendance counters.")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    args = parser.parse_args(argv)
+
+    if args.command == "verify":
+        verify()
+    else:
+        rebuild()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,73 @@
+import atexit
+import threading
 import pymongo
-from config import MONGO_URI, DATABASE_NAME, COLLECTION_NAME, COLLECTION_ENCODING
+from config import (MONGO_URI, DATABASE_NAME, COLLECTION_NAME, COLLECTION_ENCODING, SESSION_COLLECTION_NAME,
+                    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS)
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 
-import os
-import json
+# One client per process: its connection pool survives between sessions, so
+# the end-of-session write does not pay for DNS, TLS and auth again
+_client = None
+_client_lock = threading.Lock()
 
-ENCODINGS_PATH = "./encodings"  # Make sure this matches your actual path
 
-def get_faces_from_local(division):
-    """Returns list of (name, encoding) tuples from local JSON file for a specific division."""
-    encoding_file = os.path.join(ENCODINGS_PATH, f"{division}.json")
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(
+                MONGO_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            )
+        return _client
 
-    if not os.path.exists(encoding_file):
-        print(f"❌ Encoding file for Division '{division}' not found.")
-        return []
 
-    with open(encoding_file, "r") as f:
-        data = json.load(f)
+def get_collection(division=None):
+    """Returns the attendance collection (the same for every division)."""
+    return get_client()[DATABASE_NAME][COLLECTION_NAME]
 
-    all_faces = []
-    for name, encodings in data.items():
-        for enc in encodings:
-            all_faces.append((name, enc))
 
-    return all_faces
+def get_session_collection():
+    """Returns the collection holding one document per session."""
+    return get_client()[DATABASE_NAME][SESSION_COLLECTION_NAME]
 
 
-from pymongo import MongoClient
-def get_collection(division):
-    client = MongoClient(MONGO_URI)
-    db = client['wallseye']
-    return db['Attendance']
+_session_indexes_ready = False
+
+
+def ensure_session_indexes():
+    """Creates the session collection's indexes, once per process (create_index is a no-op if they exist)."""
+    global _session_indexes_ready
+    if _session_indexes_ready:
+        return
+    sessions = get_session_collection()
+    sessions.create_index([("division", pymongo.ASCENDING), ("subject", pymongo.ASCENDING), ("date", pymongo.ASCENDING)])
+    # Reports filter by semester and subject over a date range
+    sessions.create_index([("semester", pymongo.ASCENDING), ("subject", pymongo.ASCENDING), ("date", pymongo.ASCENDING)])
+    _session_indexes_ready = True
+
+
+def warm_up_client():
+    """Opens and pings the connection, e.g. when a session starts. Returns False if Mongo is unreachable."""
+    try:
+        get_client().admin.command("ping")
+        return True
+    except PyMongoError as e:
+        print(f"⚠️ MongoDB is not reachable yet: {e}")
+        return False
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(close_client)
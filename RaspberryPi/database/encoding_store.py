@@ -0,0 +1,249 @@
+"""
+Binary gallery store for face encodings.
+
+Each division is kept as two files inside ENCODINGS_PATH:
+
+    {division}.{version}.npy  contiguous float32 matrix, one 128-d encoding per row
+    {division}.index.json     {"names": [...], "offsets": [...], "sources": [...], "matrix": "{division}.{version}.npy"}
+
+Every save writes a new matrix file and then switches the index to it with
+a single rename, so a reader always sees a matrix and index that belong
+together; the matrix the replaced index named is deleted afterwards. Indexes
+without a "matrix" entry use {division}.npy. Saves of one division are
+serialized, across threads and processes, by {division}.lock.
+
+Rows offsets[i]..offsets[i + 1] of the matrix belong to names[i]. sources
+holds, per row, the dataset image the encoding came from (None for rows
+converted from the old JSON format). The matrix is opened with
+np.load(mmap_mode="r") so loading a gallery does not parse or copy anything
+until the rows are actually used.
+
+Convert the old JSON galleries once with:
+
+    python -m database.encoding_store A B      # or --all
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import fcntl
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+ENCODINGS_PATH = "./encodings"  # Make sure this matches your actual path
+ENCODING_DIM = 128
+LOAD_RETRIES = 5  # attempts to load a gallery whose matrix was replaced while it was read
+
+_save_locks = {}  # division -> threading.Lock serializing its saves within the process
+_save_locks_guard = threading.Lock()
+
+
+def _matrix_path(division, index=None):
+    filename = (index or {}).get("matrix") or f"{division}.npy"
+    return os.path.join(ENCODINGS_PATH, filename)
+
+
+def _index_path(division):
+    return os.path.join(ENCODINGS_PATH, f"{division}.index.json")
+
+
+def _json_path(division):
+    return os.path.join(ENCODINGS_PATH, f"{division}.json")
+
+
+@contextmanager
+def _division_lock(division):
+    """Holds the save lock of a division: a thread lock, plus a file lock for other processes."""
+    with _save_locks_guard:
+        lock = _save_locks.setdefault(division, threading.Lock())
+    with lock:
+        os.makedirs(ENCODINGS_PATH, exist_ok=True)
+        with open(os.path.join(ENCODINGS_PATH, f"{division}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def gallery_exists(division):
+    # The index is written last, so it only exists once its matrix does
+    return os.path.exists(_index_path(division))
+
+
+def gallery_version(division):
+    """Changes whenever the gallery of a division is rewritten, None if there is none."""
+    try:
+        st = os.stat(_index_path(division))
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def save_gallery(division, person_encodings, person_sources=None):
+    """
+    Writes {name: [encoding, ...]} as a float32 matrix plus names/offsets index.
+
+    person_sources optionally gives, for every name, the source image of each
+    encoding in the same order.
+    """
+    with _division_lock(division):
+        _write_gallery(division, person_encodings, person_sources)
+
+
+def _write_gallery(division, person_encodings, person_sources=None):
+    # Callers hold the division lock
+    names = []
+    offsets = [0]
+    rows = []
+    sources = []
+    for name, encodings in person_encodings.items():
+        if len(encodings) == 0:
+            continue
+        names.append(name)
+        rows.extend(encodings)
+        offsets.append(len(rows))
+        if person_sources is not None and name in person_sources:
+            sources.extend(person_sources[name])
+        else:
+            sources.extend([None] * len(encodings))
+
+    if rows:
+        matrix = np.asarray(rows, dtype=np.float32).reshape(-1, ENCODING_DIM)
+    else:
+        matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+
+    matrix_name = f"{division}.{uuid.uuid4().hex[:12]}.npy"
+    index_file = _index_path(division)
+    old_matrix = _matrix_path(division, _load_index(division)) if gallery_exists(division) else None
+
+    # The new matrix goes to a file of its own; renaming the index over the
+    # old one is the single atomic switch to the new gallery
+    with open(os.path.join(ENCODINGS_PATH, matrix_name), "wb") as f:
+        np.save(f, np.ascontiguousarray(matrix))
+    with open(index_file + ".tmp", "w") as f:
+        json.dump({"names": names, "offsets": offsets, "sources": sources, "matrix": matrix_name}, f)
+    os.replace(index_file + ".tmp", index_file)
+
+    # Only the matrix of the index just replaced; readers that mapped it keep their mapping
+    if old_matrix is not None and os.path.basename(old_matrix) != matrix_name:
+        try:
+            os.remove(old_matrix)
+        except FileNotFoundError:
+            pass
+
+
+def _load_index(division):
+    with open(_index_path(division), "r") as f:
+        return json.load(f)
+
+
+def load_names(division):
+    """Returns the enrolled names of a division without touching the matrix."""
+    if not gallery_exists(division):
+        if not convert_json_to_store(division):
+            return []
+    return list(_load_index(division)["names"])
+
+
+def load_gallery(division):
+    """
+    Returns (matrix, labels) for a division.
+
+    matrix is a read-only memory-mapped float32 array of shape (N, 128) and
+    labels is an array of N names, one per row. Both are empty if the division
+    has no encodings.
+    """
+    empty = (np.empty((0, ENCODING_DIM), dtype=np.float32), np.empty(0, dtype=object))
+
+    if not gallery_exists(division):
+        if not convert_json_to_store(division):
+            return empty
+
+    # A save running right now may delete the matrix this index points to
+    # between the two reads; the index read next then points to the new one
+    for attempt in range(LOAD_RETRIES):
+        index = _load_index(division)
+        names = index["names"]
+        offsets = index["offsets"]
+
+        if offsets[-1] == 0:
+            return empty
+
+        try:
+            matrix = np.load(_matrix_path(division, index), mmap_mode="r")
+        except FileNotFoundError:
+            matrix = None
+        if matrix is not None and matrix.shape[0] == offsets[-1]:
+            break
+        time.sleep(0.05)
+    else:
+        rows = "no" if matrix is None else matrix.shape[0]
+        print(f"❌ Gallery for Division '{division}' is inconsistent ({rows} rows, index expects {offsets[-1]}).")
+        return empty
+
+    labels = np.repeat(np.array(names, dtype=object), np.diff(offsets))
+    return matrix, labels
+
+
+def load_person_encodings(division):
+    """Returns {name: [encoding, ...]} for a division, as stored in the gallery."""
+    matrix, labels = load_gallery(division)
+    person_encodings = {}
+    for name, encoding in zip(labels, matrix):
+        person_encodings.setdefault(name, []).append(np.array(encoding))
+    return person_encodings
+
+
+def load_person_sources(division):
+    """Returns {name: [source image or None, ...]} matching load_person_encodings."""
+    if not gallery_exists(division):
+        if not convert_json_to_store(division):
+            return {}
+
+    index = _load_index(division)
+    names = index["names"]
+    offsets = index["offsets"]
+    sources = index.get("sources") or [None] * offsets[-1]
+    return {name: sources[offsets[i]:offsets[i + 1]] for i, name in enumerate(names)}
+
+
+def convert_json_to_store(division):
+    """One shot conversion of encodings/{division}.json. Returns True if converted."""
+    json_file = _json_path(division)
+    if not os.path.exists(json_file):
+        return False
+
+    with _division_lock(division):
+        # Converted by another thread meanwhile, maybe with encodings added since
+        if gallery_exists(division):
+            return True
+        try:
+            with open(json_file, "r") as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            print(f"❌ Could not parse {json_file}.")
+            return False
+        _write_gallery(division, data)
+    print(f"💾 Converted {json_file} to binary gallery ({sum(len(v) for v in data.values())} encodings)")
+    return True
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if not argv or argv == ["--all"]:
+        divisions = [f[:-len(".json")] for f in os.listdir(ENCODINGS_PATH)
+                     if f.endswith(".json") and f.count(".") == 1]
+    else:
+        divisions = argv
+
+    for division in divisions:
+        if not convert_json_to_store(division):
+            print(f"❌ Encoding file for Division '{division}' not found.")
+
+
+if __name__ == "__main__":
+    main()
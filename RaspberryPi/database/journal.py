@@ -0,0 +1,228 @@
+"""
+Durable local journal of finished sessions, replayed to MongoDB in the background.
+
+Ending a session only commits the session (who was present, who is enrolled,
+teacher/subject/date...) to a SQLite file, which takes milliseconds and does
+not need the network. A Replayer thread then pushes every entry that was not
+sent yet through a write callback, retrying with exponential backoff while
+MongoDB is unreachable. Entries survive restarts, so a flaky tunnel or a
+reboot only delays attendance instead of losing it.
+
+Every entry carries an idempotency key which the write callback stores with
+the data, so replaying an entry whose earlier write partly went through does
+not apply it twice. Adding a key that is already journaled merges the two
+entries and sends the result again.
+
+    journal = Journal(JOURNAL_PATH)
+    replayer = Replayer(journal, write).start()
+    journal.add(key, session)
+    replayer.wake()
+
+Listeners added with replayer.add_listener(callback) are called as
+callback(key, error) after every write attempt, error being None on success.
+
+Show the entries that are still waiting with:
+
+    python -m database.journal
+"""
+import json
+import time
+import sqlite3
+import threading
+
+from config import JOURNAL_PATH, JOURNAL_RETRY_SECONDS, JOURNAL_MAX_RETRY_SECONDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    last_error TEXT,
+    sent REAL
+)
+"""
+
+
+class Journal:
+    def __init__(self, path=None):
+        self.path = path or JOURNAL_PATH
+        self._created = False
+
+    def _connect(self):
+        # One short-lived connection per call, so any thread may use the journal
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=FULL")
+        if not self._created:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            conn.commit()
+            self._created = True
+        return conn
+
+    def add(self, key, payload, merge=None):
+        """
+        Commits a session under key. If key is journaled already, its payload
+        becomes merge(old, payload) (payload without merge) and is sent again.
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                now = time.time()
+                row = conn.execute("SELECT payload FROM sessions WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    conn.execute("INSERT INTO sessions (key, payload, created, next_attempt) VALUES (?, ?, ?, ?)",
+                                 (key, json.dumps(payload), now, now))
+                else:
+                    if merge is not None:
+                        payload = merge(json.loads(row[0]), payload)
+                    conn.execute("UPDATE sessions SET payload = ?, attempts = 0, next_attempt = ?, sent = NULL "
+                                 "WHERE key = ?", (json.dumps(payload), now, key))
+        finally:
+            conn.close()
+
+    def due(self, now=None):
+        """Unsent entries whose next attempt is due, oldest first, as (key, payload, attempts)."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT key, payload, attempts FROM sessions WHERE sent IS NULL AND next_attempt <= ? "
+                                "ORDER BY created", (time.time() if now is None else now,)).fetchall()
+        finally:
+            conn.close()
+        return [(key, json.loads(payload), attempts) for key, payload, attempts in rows]
+
+    def next_attempt(self):
+        """Time of the earliest pending retry, None if everything was sent."""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT MIN(next_attempt) FROM sessions WHERE sent IS NULL").fetchone()[0]
+        finally:
+            conn.close()
+
+    def mark_sent(self, key, payload):
+        """Marks the entry sent, unless it was merged with a newer payload while that was written."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("UPDATE sessions SET sent = ?, last_error = NULL WHERE key = ? AND payload = ?",
+                             (time.time(), key, json.dumps(payload)))
+        finally:
+            conn.close()
+
+    def mark_failed(self, key, error, delay):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("UPDATE sessions SET attempts = attempts + 1, last_error = ?, next_attempt = ? "
+                             "WHERE key = ?", (str(error), time.time() + delay, key))
+        finally:
+            conn.close()
+
+    def status(self, key):
+        """"sent" or "pending" for a journaled key, None if it was never journaled."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT sent FROM sessions WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return "pending" if row[0] is None else "sent"
+
+    def pending(self):
+        """Every unsent entry as (key, created, attempts, last_error)."""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT key, created, attempts, last_error FROM sessions WHERE sent IS NULL "
+                                "ORDER BY created").fetchall()
+        finally:
+            conn.close()
+
+
+class Replayer:
+    """Background thread writing journaled sessions until each one succeeded."""
+
+    def __init__(self, journal, write, retry_seconds=None, max_retry_seconds=None):
+        self.journal = journal
+        self.write = write  # write(key, payload), raises if the session was not stored
+        self.retry_seconds = retry_seconds or JOURNAL_RETRY_SECONDS
+        self.max_retry_seconds = max_retry_seconds or JOURNAL_MAX_RETRY_SECONDS
+        self.cond = threading.Condition()
+        self.woken = False
+        self.stopping = False
+        self.thread = None
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+        return self
+
+    def _notify(self, key, error):
+        for callback in self.listeners:
+            try:
+                callback(key, error)
+            except Exception as e:
+                print(f"⚠️ Journal listener failed for session {key}: {e}")
+
+    def start(self):
+        with self.cond:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping = False
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return self
+
+    def wake(self):
+        """Makes the thread look at the journal now, e.g. after a session was added."""
+        with self.cond:
+            self.woken = True
+            self.cond.notify_all()
+
+    def stop(self, timeout=None):
+        """Lets the thread finish one last pass over the due entries, waiting at most timeout seconds."""
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def replay(self):
+        """Writes every due entry once. Returns how many were sent."""
+        sent = 0
+        for key, payload, attempts in self.journal.due():
+            try:
+                self.write(key, payload)
+            except Exception as e:
+                delay = min(self.retry_seconds * 2 ** attempts, self.max_retry_seconds)
+                print(f"⚠️ Could not write session {key} to MongoDB, retrying in {delay:.0f}s: {e}")
+                self.journal.mark_failed(key, e, delay)
+                self._notify(key, e)
+            else:
+                self.journal.mark_sent(key, payload)
+                self._notify(key, None)
+                sent += 1
+        return sent
+
+    def _run(self):
+        while True:
+            try:
+                self.replay()
+                next_attempt = self.journal.next_attempt()
+            except sqlite3.Error as e:
+                print(f"❌ Attendance journal error: {e}")
+                next_attempt = time.time() + self.retry_seconds
+            with self.cond:
+                if self.stopping:
+                    return
+                timeout = None if next_attempt is None else max(next_attempt - time.time(), 0)
+                self.cond.wait_for(lambda: self.woken or self.stopping, timeout=timeout)
+                self.woken = False
+
+
+if __name__ == "__main__":
+    entries = Journal().pending()
+    for key, created, attempts, last_error in entries:
+        print(f"{key}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(created))}  "
+              f"{attempts} attempts  {last_error or ''}")
+    print(f"{len(entries)} sessions waiting to be written")
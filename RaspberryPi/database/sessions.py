@@ -0,0 +1,181 @@
+"""
+Session-centric attendance: one small document per session.
+
+    {"_id": <session key>, "teacher": ..., "division": "A", "subject": "CS232",
+     "semester": "4", "date": "2025-04-23", "time": "10 AM",
+     "present": ["..."], "absent": ["..."], "total": 60, "attended": 52}
+
+Besides pushing to every student's attendance.<semester>.<subject> array,
+the writer stores the session here, so per-date and per-subject queries read
+a few indexed documents (division/subject/date and semester/subject/date)
+instead of loading every student's whole history.
+
+Sessions written before this collection existed are rebuilt from the student
+documents with:
+
+    python -m database.sessions backfill [--dry-run]
+
+Entries are grouped by the session key stored with them, or by semester,
+subject, teacher, date and time for entries older than session keys. Such
+sessions get the key session_id() derives once their division is known from
+the local galleries; groups that end up with the same key are merged. Any
+group whose division no gallery knows is reported and skipped. The student
+documents are left untouched.
+"""
+import os
+import hashlib
+import argparse
+from collections import Counter
+
+from pymongo import ReplaceOne
+
+from database.database import get_collection, get_session_collection, ensure_session_indexes
+from database.encoding_store import ENCODINGS_PATH, load_names
+
+BACKFILL_BATCH = 500  # session documents per bulk write
+
+
+def session_document(key, session):
+    """Builds the session document of a journaled session."""
+    present = set(session["present"])
+    return {
+        "_id": key,
+        "teacher": session["teacher"],
+        "division": session["division"],
+        "subject": session["subject"],
+        "semester": session["semester"],
+        "date": session["date"],
+        "time": session["time"],
+        "present": sorted(present),
+        "absent": sorted(set(session["students"]) - present),
+        "total": len(session["students"]),
+        "attended": len(present),
+    }
+
+
+def write_session_document(key, session):
+    """Stores the session document; writing the same session again just replaces it."""
+    ensure_session_indexes()
+    get_session_collection().replace_one({"_id": key}, session_document(key, session), upsert=True)
+
+
+def session_id(teacher, division, subject, date, time):
+    """
+    Deterministic key of a session. Recording the same session twice, e.g.
+    after a restart, yields the same key, so its writes can be replayed safely.
+    """
+    parts = (teacher, division, subject, date, time)
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+
+
+def legacy_session_key(semester, subject, entry):
+    parts = (semester, subject, entry.get("teacher"), entry.get("date"), entry.get("time"))
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+
+
+def _student_divisions():
+    """Maps every enrolled name to its division, from the local galleries."""
+    divisions = {}
+    if not os.path.isdir(ENCODINGS_PATH):
+        return divisions
+    for filename in os.listdir(ENCODINGS_PATH):
+        if filename.endswith(".index.json"):
+            division = filename[:-len(".index.json")]
+            for name in load_names(division):
+                divisions[name] = division
+    return divisions
+
+
+def collect_sessions(students):
+    """Groups the attendance entries of student documents into session documents."""
+    sessions = {}
+    for student in students:
+        for semester, subjects in (student.get("attendance") or {}).items():
+            if not isinstance(subjects, dict):
+                continue
+            for subject, entries in subjects.items():
+                for entry in entries or []:
+                    key = entry.get("session") or legacy_session_key(semester, subject, entry)
+                    doc = sessions.get(key)
+                    if doc is None:
+                        doc = sessions[key] = {
+                            "_id": key, "teacher": entry.get("teacher"), "division": None, "subject": subject,
+                            "semester": semester, "date": entry.get("date"), "time": entry.get("time"),
+                            "present": [], "absent": [], "legacy": "session" not in entry,
+                        }
+                    doc["present" if entry.get("status") == "present" else "absent"].append(student["_id"])
+    return sessions
+
+
+def merge_session_documents(doc, other):
+    """
+    Merges two groups that turned out to be the same session, e.g. legacy
+    groups of different semesters. A student present in either is present.
+    """
+    doc["present"] += other["present"]
+    doc["absent"] += other["absent"]
+    return doc
+
+
+def backfill(dry_run=False):
+    divisions = _student_divisions()
+    students = get_collection().find({"attendance": {"$exists": True}}, {"attendance": 1})
+    sessions = collect_sessions(students)
+
+    unresolved = []
+    for key, doc in list(sessions.items()):
+        known = Counter(divisions[name] for name in doc["present"] + doc["absent"] if name in divisions)
+        if known:
+            doc["division"] = known.most_common(1)[0][0]
+        legacy = doc.pop("legacy")
+        if doc["division"] is None:
+            # A legacy key would hash "None" in place of the division, and a
+            # session key would replace the document its writer stored with
+            # one without a division, so leave it until the gallery is there
+            del sessions[key]
+            unresolved.append(doc)
+        elif legacy:
+            del sessions[key]
+            doc["_id"] = session_id(doc["teacher"], doc["division"], doc["subject"], doc["date"], doc["time"])
+            other = sessions.get(doc["_id"])
+            if other is not None:
+                doc = merge_session_documents(other, doc)
+            sessions[doc["_id"]] = doc
+
+    for doc in sessions.values():
+        doc["present"] = sorted(set(doc["present"]))
+        doc["absent"] = sorted(set(doc["absent"]) - set(doc["present"]))
+        doc["total"] = len(doc["present"]) + len(doc["absent"])
+        doc["attended"] = len(doc["present"])
+
+    for doc in unresolved:
+        print(f"⚠️ Skipped a session of {doc['subject']} on {doc['date']} {doc['time']} by {doc['teacher']}: "
+              f"no division gallery knows any of its {len(doc['present']) + len(doc['absent'])} students.")
+    print(f"🗂️ Found {len(sessions)} sessions in the student documents"
+          f"{f', skipped {len(unresolved)} without a known division' if unresolved else ''}.")
+    if dry_run or not sessions:
+        return len(sessions)
+
+    ensure_session_indexes()
+    docs = list(sessions.values())
+    for start in range(0, len(docs), BACKFILL_BATCH):
+        batch = docs[start:start + BACKFILL_BATCH]
+        get_session_collection().bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in batch],
+                                            ordered=False)
+        print(f"💾 Wrote {start + len(batch)}/{len(docs)} session documents.")
+    return len(sessions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the session-centric attendance collection.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = commands.add_parser("backfill", help="rebuild session documents from the student documents")
+    backfill_parser.add_argument("--dry-run", action="store_true", help="only count the sessions")
+    args = parser.parse_args(argv)
+
+    if args.command == "backfill":
+        backfill(dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,19 @@ import os
 import json
 import numpy as np
 import face_recognition
-from picamera2 import Picamera2
 import cv2
 import threading
 import time
-from database.database import get_faces_from_local
-from utils.temp_storage import save_to_temp, send_data_to_mongodb
-from database.database import get_collection
+from enrollment import encode_division, enrollment_status, pause_enrollment, resume_enrollment, start_background_enrollment
+from utils.temp_storage import save_to_temp, send_data_to_mongodb, session_id
+from utils.gallery_cache import GalleryCache
+from utils.scheduler import FrameScheduler
+from utils.preview import preview_stream
+from utils.camera import open_camera
+from recognition import process_frame, stage_seconds
+from pipeline import FramePipeline, Voter
+from config import GALLERY_CACHE_MB
+from database.database import warm_up_client
 
 import signal
 import sys
@@ -19,123 +25,57 @@ ENCODINGS_PATH = "./encodings"
 
 
 
-latest_frame = None
-frame_lock = threading.Lock()
-
-
 def capture_frames():
-    global latest_frame
-    picam2 = Picamera2()
-    picam2.preview_configuration.main.size = (640, 480)
-    picam2.preview_configuration.main.format = "RGB888"
-    picam2.configure("preview")
-    picam2.start()
+    camera.start()
 
     while True:
-        frame = picam2.capture_array()
-        with frame_lock:
-            latest_frame = frame  # Store the latest frame for processing
-            
-
-def preprocess_frame(frame):
-    """Enhances frame quality using filters for better face recognition."""
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-    # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-    enhanced_gray = clahe.apply(gray)
-
-    # Convert back to RGB
-    enhanced_frame = cv2.cvtColor(enhanced_gray, cv2.COLOR_GRAY2BGR)
+        frame, luma = camera.read()
+        if frame is None:
+            print("⚠️ Camera returned no frame.")
+            time.sleep(0.5)
+            continue
+        # Motion is judged on the small luma stream when there is one
+        if scheduler.should_process(frame if luma is None else luma):
+            pipeline.submit(frame, luma=luma)  # written into the shared frame rings the workers read from
 
-    # Apply Bilateral Filtering to remove noise while keeping edges sharp
-    filtered_frame = cv2.bilateralFilter(enhanced_frame, d=9, sigmaColor=75, sigmaSpace=75)
 
-    return filtered_frame
+# Galleries stay loaded between sessions of the long running service
+galleries = GalleryCache(GALLERY_CACHE_MB * 1024 * 1024)
 
-flag_check = True
 
 def encode_faces(division):
-    division_path = os.path.join(DATASET_PATH, division)
-    encoding_file = os.path.join(ENCODINGS_PATH, f"{division}.json")
-    os.makedirs(ENCODINGS_PATH, exist_ok=True)
-    limit = 10
-    count = 0
-
-    if not os.path.isdir(division_path):
-        print(f"❌ Division folder '{division}' not found.")
-        return
-
-    if os.path.exists(encoding_file):
-        with open(encoding_file, "r") as f:
-            existing_encodings = json.load(f)
-    else:
-        existing_encodings = {}
-
-    person_encodings = existing_encodings.copy()
-
-    for person_name in os.listdir(division_path):
-        if count>limit:
-            print(f"limit of {limit}  persons exceed")
-            flag_check = False
-            break
-
-        if person_name in existing_encodings:
-            print(f"⏭️ Skipping {person_name}, already encoded.")
-            continue
-	
-        count+=1
-
-        person_path = os.path.join(division_path, person_name)
-        if not os.path.isdir(person_path):
-            continue
-
-        encodings = []
-        for img_name in os.listdir(person_path):
-            img_path = os.path.join(person_path, img_name)
-            image = face_recognition.load_image_file(img_path)
-            face_encs = face_recognition.face_encodings(image)
-            if face_encs:
-                encodings.append(face_encs[0].tolist())
-                print(f"✅ Encoded {img_name} for {person_name}")
-            else:
-                print(f"❌ No face found in {img_name}")
-
-        if encodings:
-            person_encodings[person_name] = encodings
-          
-        
-        
-    with open(encoding_file, "w") as f:
-        json.dump(person_encodings, f, indent=2)
-    print(f"💾 Saved local encodings to {encoding_file}")
+    """Enrolls a whole division in the foreground (sessions use the background job instead)."""
+    encode_division(division)
    
 
+# Detection and encoding workers are shared by all sessions. They are forked
+# before the camera starts so they do not inherit it, and only process frames
+# while a session is running.
+camera = open_camera()
+pipeline = FramePipeline(frame_shape=camera.frame_shape, luma_shape=camera.luma_shape).start(active=False)
+# Picks the frames worth processing from motion and the measured processing cost
+scheduler = FrameScheduler(workers=pipeline.detect_workers + pipeline.encode_workers)
+
 camera_thread = threading.Thread(target=capture_frames, daemon=True)
 camera_thread.start()
 
-import matplotlib.pyplot as plt
-
 def recognize_faces(teacher, division, subject, date, timing, semester):
-    known_faces = get_faces_from_local(division)
-    if not known_faces:
+    """Runs one session. Returns its attendance key once it is journaled, None if nothing was recorded."""
+    matcher = galleries.get(division)
+    if len(matcher) == 0:
         print(f"? No encodings found for Division {division}.")
-        return
-
-    known_names = [face[0] for face in known_faces]
-    known_encodings = [np.array(face[1]) for face in known_faces]
+        return None
 
-    framecount = 0
-    recognition_count = {}
-    cooldown_counter={}
-    confirmed_recognitions = set()
-    accuracy_log={}
+    voter = Voter()
+    session = session_id(teacher, division, subject, date, timing)
+    key = None
 
     print("? Starting recognition. Will run for 2 minutes or until Ctrl+C.")
     start_time = time.monotonic()
     duration_limit = 120  # seconds
 
-    plt.ion()  # Interactive mode on
+    pipeline.activate()  # only frames captured from now on
+    scheduler.reset()
 
     try:
         while True:
@@ -143,159 +83,113 @@ def recognize_faces(teacher, division, subject, date, timing, semester):
                 print("?? Time limit reached. Stopping recognition.")
                 break
 
-            with frame_lock:
-                if latest_frame is None:
-                    continue
-                frame = latest_frame.copy()
-
-            if framecount % 5 == 0:
-                enhanced_frame = preprocess_frame(frame)
-                rgb_frame = cv2.cvtColor(enhanced_frame, cv2.COLOR_BGR2RGB)
-
-                face_locations = face_recognition.face_locations(rgb_frame, model="hog")
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations, num_jitters=1)
-
-                current_frame_names = []
-
-                for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-                    face_distances = face_recognition.face_distance(known_encodings, face_encoding)
-                    best_match_index = np.argmin(face_distances)
-                    name = "Unknown"
-
-                    if face_distances[best_match_index] < 0.5:
-                        name = known_names[best_match_index]
-                        recognition_count[name] = recognition_count.get(name, 0) + 1
-                        cooldown_counter[name] = 0
-
-                        print(f"? Matched: {name}, Count: {recognition_count[name]}, Distance: {face_distances[best_match_index]:.4f}")
-                        
-                        if name not in accuracy_log:
-                            accuracy_log[name]=[]
-                        accuracy_log[name].append(face_distances[best_match_index])
-                        
-                        if recognition_count[name] >= 10 and name not in confirmed_recognitions:
-                            print(f"? Confirmed: {name} recognized consistently.")
-                            save_to_temp(name, division)
-                            confirmed_recognitions.add(name)
-                            recognition_count[name] = 10
-
-                    cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                    cv2.putText(frame, f"{name} ({face_distances[best_match_index]:.2f})",
-                                (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-                    current_frame_names.append(name)
-
-                for registered_name in list(recognition_count.keys()):
-                    if registered_name not in confirmed_recognitions:
-                        if registered_name not in current_frame_names:
-                            cooldown_counter[registered_name] = cooldown_counter.get(registered_name, 0) + 1
-                            if cooldown_counter[registered_name] >= 5:
-                                recognition_count[registered_name] = 0
-                                cooldown_counter[registered_name] = 0
-                        else:
-                            cooldown_counter[registered_name] = 0
-                            
-                # Show frame using matplotlib
-                plt.imshow(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                plt.axis("off")
-                plt.title("Live Recognition (Close this window or press Ctrl+C to stop)")
-                plt.pause(0.001)
-                plt.clf()
-
-            framecount += 1
-            time.sleep(0.02)
+            # The camera thread feeds the pipeline, which skips what it cannot keep up with
+            result = pipeline.get_result(timeout=0.1)
+            if result is None:
+                continue
+            scheduler.record(stage_seconds(result.timings))
+
+            matches = matcher.match(result.face_encodings)
+            pipeline.review(result, matches)  # weak matches get re-encoded instead of reused
+            for name in voter.update(matches, result.fresh):
+                save_to_temp(name, division, session, voter.accuracy_log[name][-1])
+
+            # Headless; the frame is only fetched when someone watches /preview
+            if preview_stream.active():
+                preview = pipeline.frame(result.seq)
+                if preview is not None:  # else already overwritten in the ring
+                    preview_stream.publish(preview, result.face_locations,
+                                           [f"{match.name} ({match.distance:.2f})" for match in matches])
 
     except KeyboardInterrupt:
         print("? Ctrl+C pressed by user.")
 
     finally:
+        stats = scheduler.stats()
+        print(f"? {pipeline.dropped} of {pipeline.submitted} frames skipped by the pipeline, "
+              f"{stats['skipped_static']} static and {stats['skipped_busy']} over budget skipped by the scheduler.")
+        pipeline.deactivate()
+        # Only journals the session; the MongoDB write happens in the background
+        # while the next session already runs
         print("? Saving data to MongoDB...")
-        plt.ioff()
-        plt.close()
-        collection = get_collection(division)
-        send_data_to_mongodb(collection, teacher, division, subject, date, timing, semester)
+        key = send_data_to_mongodb(teacher, division, subject, date, timing, semester, session)
+    return key
 
 def recognizefaces(teacher, division, subject, date, timing, semester):
-    known_faces = get_faces_from_local(division)
-    if not known_faces:
+    matcher = galleries.get(division)
+    if len(matcher) == 0:
         print(f"? No encodings found for Division {division}.")
         return
 
-    known_names = [face[0] for face in known_faces]
-    known_encodings = [np.array(face[1]) for face in known_faces]
-
-    framecount = 0
+    last_seq = 0
     recognition_count = {}
     confirmed_recognitions = set()
+    session = session_id(teacher, division, subject, date, timing)
 
     print("? Starting recognition. Press 'q' or Ctrl+C to stop.")
 
     try:
         while True:
-            with frame_lock:
-                if latest_frame is None:
-                    continue
-                frame = latest_frame.copy()
-
-            if framecount % 5 == 0:
-                # Preprocess and convert frame to RGB
-                enhanced_frame = preprocess_frame(frame)
-                rgb_frame = cv2.cvtColor(enhanced_frame, cv2.COLOR_BGR2RGB)
+            seq, _, view = pipeline.ring.wait_newer(last_seq, timeout=0.1)
+            if seq is None:
+                continue
+            last_seq = seq
+            frame = view.copy()
 
-                # Detect and encode faces
-                face_locations = face_recognition.face_locations(rgb_frame, model="hog")
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations, num_jitters=1)
+            # The capture thread only hands over frames the scheduler picked
+            start = time.perf_counter()
+            # Preprocess, detect, encode and match faces
+            face_locations, matches, _ = process_frame(frame, matcher)
 
-                current_frame_names = []
+            current_frame_names = []
 
-                for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-                    face_distances = face_recognition.face_distance(known_encodings, face_encoding)
-                    best_match_index = np.argmin(face_distances)
-                    name = "Unknown"
+            for (top, right, bottom, left), match in zip(face_locations, matches):
+                name = match.name
 
-                    if face_distances[best_match_index] < 0.5:
-                        name = known_names[best_match_index]
-                        recognition_count[name] = recognition_count.get(name, 0) + 1
+                if name != "Unknown":
+                    recognition_count[name] = recognition_count.get(name, 0) + 1
 
-                        print(f"? Matched: {name}, Count: {recognition_count[name]}, Distance: {face_distances[best_match_index]:.4f}")
+                    print(f"? Matched: {name}, Count: {recognition_count[name]}, Distance: {match.distance:.4f}")
 
-                        if recognition_count[name] >= 10 and name not in confirmed_recognitions:
-                            print("\n")
-                            print(f"? Confirmed: {name} recognized consistently.\n")
-                            save_to_temp(name, division)
-                            confirmed_recognitions.add(name)
+                    if recognition_count[name] >= 10 and name not in confirmed_recognitions:
+                        print("\n")
+                        print(f"? Confirmed: {name} recognized consistently.\n")
+                        save_to_temp(name, division, session, match.distance)
+                        confirmed_recognitions.add(name)
 
-                    cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                    cv2.putText(frame, f"{name} ({face_distances[best_match_index]:.2f})",
-                                (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+                cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+                cv2.putText(frame, f"{name} ({match.distance:.2f})",
+                            (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
-                    current_frame_names.append(name)
+                current_frame_names.append(name)
 
-                # Reset count for those not detected in this frame
-                for registered_name in list(recognition_count.keys()):
-                    if registered_name not in current_frame_names:
-                        recognition_count[registered_name] = 0
+            # Reset count for those not detected in this frame
+            for registered_name in list(recognition_count.keys()):
+                if registered_name not in current_frame_names:
+                    recognition_count[registered_name] = 0
 
-                # Optional: display the frame
-                # cv2.imshow("Face Recognition", frame)
+            # Optional: display the frame
+            # cv2.imshow("Face Recognition", frame)
 
-            framecount += 1
-            time.sleep(0.02)
+            scheduler.record(time.perf_counter() - start)
 
             # Stop via keypress
             if cv2.waitKey(1) & 0xFF == ord("q"):
                 print("? Stopping... Sending data to MongoDB.")
-                collection = get_collection(division)
-                send_data_to_mongodb(collection, teacher, division, subject, date, timing, semester)
+                send_data_to_mongodb(teacher, division, subject, date, timing, semester, session)
                 break
 
     except KeyboardInterrupt:
         print("? Interrupted by user. Sending data to MongoDB.")
-        collection = get_collection(division)
-        send_data_to_mongodb(collection, teacher, division, subject, date, timing, semester)
+        send_data_to_mongodb(teacher, division, subject, date, timing, semester, session)
 
     cv2.destroyAllWindows()
 
+def attendance_key(data):
+    """Key the attendance of a submitted session is journaled and written under."""
+    return session_id(data['teacherName'], data['division'], data['subject'], data['date'], data['time'])
+
+
 def handle_data(data):
     teacher = data['teacherName']
     division = data['division']
@@ -304,14 +198,22 @@ def handle_data(data):
     timing = data['time']
     semester = data['semester']  # Ensure the frontend sends thi
 
-    encode_faces(division)
-    if(flag_check):
-        recognize_faces(teacher, division, subject, date, timing, semester)
-    else:
-        print("skipped recognize_faces due to limit of encoding exceed")
+    # Never wait for enrollment: start with whatever gallery is ready and
+    # keep the CPU for recognition while the session runs
+    status = enrollment_status(division)
+    if status["state"] != "ready":
+        print(f"⚠️ Enrollment of Division {division} is {status['state']} ({status['pending']} images pending), "
+              f"recognizing with the gallery that is ready.")
 
-#agar yaad aye to condition check kr lena nhi to hata dena
-#danger
+    # Connect to Mongo while recognition runs, so the final write finds a warm connection
+    threading.Thread(target=warm_up_client, daemon=True).start()
+
+    pause_enrollment()
+    try:
+        return recognize_faces(teacher, division, subject, date, timing, semester)
+    finally:
+        resume_enrollment()
+        start_background_enrollment()
 
 
 #data = {"teacherName":"ChandraPrakash", "division":"B", "subject":"CS232", "date":"2025-04-23", "time":"10 AM", "semester":"4"}
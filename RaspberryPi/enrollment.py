@@ -0,0 +1,387 @@
+"""
+Face enrollment: turns processed_dataset/{division}/{person}/*.jpg into the
+division gallery kept by database/encoding_store.py.
+
+Images are encoded on a process pool so every core of the Pi does work. Each
+worker imports face_recognition, and with it the dlib models, only once.
+Results come back in submission order, so the gallery is identical to the
+one produced by the serial path (workers=1).
+
+encodings/{division}.manifest.json records the content hash, mtime and size
+of every image that has been encoded, so a run only encodes images that were
+added or changed and drops encodings of images that were deleted.
+
+Enrollment normally runs as a background job between sessions
+(start_background_enrollment). It has a time budget, checkpoints as it goes,
+pauses while a session is running and resumes where it stopped, so sessions
+always start against whatever gallery is ready (see enrollment_status).
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+
+from config import ENROLL_WORKERS, ENROLL_BUDGET, ENROLL_CHECKPOINT, ENROLL_NICE
+from database.encoding_store import ENCODINGS_PATH, load_person_encodings, load_person_sources, save_gallery
+
+DATASET_PATH = "./processed_dataset"
+
+face_recognition = None  # imported lazily so the parent does not pay for the models
+
+# Enrollment starts its pool from a background thread of a process that already
+# runs the camera, Flask and database threads; forking that could deadlock on a
+# lock some thread held, so workers come from a clean forkserver process instead.
+# They import the main script, which therefore must not do anything on import.
+_mp = multiprocessing.get_context("forkserver")
+
+
+def _load_models():
+    global face_recognition
+    if face_recognition is None:
+        import face_recognition as fr
+        face_recognition = fr
+
+
+def _init_worker():
+    # Stay out of the way of recognition if a session starts meanwhile
+    if ENROLL_NICE:
+        os.nice(ENROLL_NICE)
+    _load_models()
+
+
+def resolve_workers(workers=None):
+    if workers is None:
+        workers = ENROLL_WORKERS
+    if not workers or workers < 1:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def encode_image(task):
+    """
+    Encodes the first face of one image. Returns (person, path, encoding or
+    None, seconds, error or None); an image that cannot be read or decoded
+    comes back with its error instead of stopping the run.
+    """
+    person_name, img_path = task
+    _load_models()
+    start = time.perf_counter()
+    try:
+        image = face_recognition.load_image_file(img_path)
+        face_encs = face_recognition.face_encodings(image)
+    except Exception as e:
+        return person_name, img_path, None, time.perf_counter() - start, str(e) or type(e).__name__
+    encoding = face_encs[0].tolist() if face_encs else None
+    return person_name, img_path, encoding, time.perf_counter() - start, None
+
+
+def encode_images(tasks, workers=None):
+    """Yields encode_image results for (person, path) tasks in order, printing progress."""
+    workers = min(resolve_workers(workers), max(len(tasks), 1))
+    total = len(tasks)
+    if total == 0:
+        return
+
+    pool = None
+    if workers > 1:
+        pool = _mp.Pool(processes=workers, initializer=_init_worker)
+        results = pool.imap(encode_image, tasks)
+    else:
+        results = map(encode_image, tasks)
+
+    start = time.perf_counter()
+    try:
+        for done, result in enumerate(results, 1):
+            person_name, img_path, encoding, seconds, error = result
+            rate = done / (time.perf_counter() - start)
+            img_name = os.path.basename(img_path)
+            if error is not None:
+                print(f"⚠️ Could not encode {img_name} for {person_name}: {error} [{done}/{total}]")
+            elif encoding is not None:
+                print(f"✅ Encoded {img_name} for {person_name} [{done}/{total}, {seconds:.2f}s, {rate:.2f} img/s]")
+            else:
+                print(f"❌ No face found in {img_name} [{done}/{total}, {seconds:.2f}s, {rate:.2f} img/s]")
+            yield result
+
+        elapsed = time.perf_counter() - start
+        print(f"⚡ Encoded {total} images in {elapsed:.1f}s ({total / elapsed:.2f} img/s, {workers} worker(s))")
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def _manifest_path(division):
+    return os.path.join(ENCODINGS_PATH, f"{division}.manifest.json")
+
+
+def load_manifest(division):
+    """Returns {relative image path: {"person", "sha1", "mtime", "size", "face"[, "error"]}}."""
+    try:
+        with open(_manifest_path(division), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(division, manifest):
+    manifest_file = _manifest_path(division)
+    with open(manifest_file + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_file + ".tmp", manifest_file)
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def scan_division(division_path):
+    """Returns {relative image path: (person, absolute path, stat)} in listing order."""
+    images = {}
+    for person in os.scandir(division_path):
+        if not person.is_dir():
+            continue
+        for image in os.scandir(person.path):
+            # Hidden files are downloads still in progress (fetch_images.py)
+            if image.is_file() and not image.name.startswith("."):
+                images[f"{person.name}/{image.name}"] = (person.name, image.path, image.stat())
+    return images
+
+
+def plan_division(division_path, manifest):
+    """
+    Compares the dataset with the manifest.
+
+    Returns (images, pending, removed, touched): pending images are new or
+    changed and need encoding, removed ones are gone from disk and touched
+    ones only changed mtime, so their manifest entry is refreshed.
+    """
+    images = scan_division(division_path)
+    pending = []
+    touched = []
+
+    for rel, (person, path, st) in images.items():
+        entry = manifest.get(rel)
+        if entry and entry["person"] == person and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            continue
+        sha1 = file_sha1(path)
+        if entry and entry["person"] == person and entry["sha1"] == sha1:
+            touched.append((rel, sha1))
+        else:
+            pending.append((rel, sha1))
+
+    removed = [rel for rel in manifest if rel not in images]
+    return images, pending, removed, touched
+
+
+def _save_checkpoint(division, images, rows, legacy, manifest):
+    """Rebuilds the gallery from encoded rows in dataset order and saves it with the manifest."""
+    person_encodings = {}
+    person_sources = {}
+    for rel, (person_name, path, st) in images.items():
+        if rel in rows:
+            person_encodings.setdefault(person_name, []).append(rows[rel])
+            person_sources.setdefault(person_name, []).append(rel)
+    for person_name, encodings in legacy.items():
+        if person_name not in person_encodings:
+            person_encodings[person_name] = encodings
+            person_sources[person_name] = [None] * len(encodings)
+
+    save_gallery(division, person_encodings, person_sources)
+    save_manifest(division, manifest)
+    return len(person_encodings)
+
+
+def encode_division(division, workers=None, budget=None, should_stop=None):
+    """
+    Brings the division gallery in line with processed_dataset/{division}.
+
+    Only images that are new or whose content changed are encoded, and
+    encodings of deleted images are dropped. An unchanged dataset costs one
+    stat per image.
+
+    The run stops early once budget seconds have passed or should_stop()
+    returns True. Progress is checkpointed every ENROLL_CHECKPOINT images, so
+    the next run resumes where this one stopped. Returns True once every
+    image of the division is enrolled.
+    """
+    division_path = os.path.join(DATASET_PATH, division)
+    os.makedirs(ENCODINGS_PATH, exist_ok=True)
+
+    if not os.path.isdir(division_path):
+        print(f"❌ Division folder '{division}' not found.")
+        _set_status(division, state="missing")
+        return True
+
+    start = time.monotonic()
+    manifest = load_manifest(division)
+    images, pending, removed, touched = plan_division(division_path, manifest)
+
+    for rel, sha1 in touched:
+        st = images[rel][2]
+        manifest[rel].update(mtime=st.st_mtime_ns, size=st.st_size)
+
+    if not pending and not removed:
+        if touched:
+            save_manifest(division, manifest)
+        print(f"⏭️ Gallery for Division {division} is up to date ({len(images)} images).")
+        _set_status(division, state="ready", pending=0, images=len(images))
+        return True
+
+    # Encoded rows keyed by source image, plus rows converted from the old
+    # JSON format which are kept until the person has been re-encoded
+    rows = {}
+    legacy = {}
+    sources = load_person_sources(division)
+    for person_name, encodings in load_person_encodings(division).items():
+        for source, encoding in zip(sources.get(person_name, []), encodings):
+            if source is None:
+                legacy.setdefault(person_name, []).append(encoding)
+            else:
+                rows[source] = encoding
+
+    for rel in removed:
+        print(f"🗑️ Dropping {rel}, removed from dataset.")
+        rows.pop(rel, None)
+        del manifest[rel]
+
+    _set_status(division, state="running", pending=len(pending), images=len(images))
+
+    encoded = 0
+    tasks = [(images[rel][0], images[rel][1]) for rel, sha1 in pending]
+    results = encode_images(tasks, workers)
+    try:
+        for (rel, sha1), result in zip(pending, results):
+            person_name, img_path, encoding, seconds, error = result
+            st = images[rel][2]
+            # An unreadable image is recorded too, so it is only retried once the file changes
+            manifest[rel] = {"person": person_name, "sha1": sha1, "mtime": st.st_mtime_ns,
+                             "size": st.st_size, "face": encoding is not None}
+            if error is not None:
+                manifest[rel]["error"] = error
+            rows.pop(rel, None)
+            if encoding is not None:
+                rows[rel] = encoding
+            encoded += 1
+
+            if encoded % ENROLL_CHECKPOINT == 0:
+                people = _save_checkpoint(division, images, rows, legacy, manifest)
+                _set_status(division, pending=len(pending) - encoded, people=people)
+
+            if budget is not None and time.monotonic() - start >= budget:
+                print(f"⏸️ Enrollment budget of {budget:.0f}s used up for Division {division}.")
+                break
+            if should_stop is not None and should_stop():
+                print(f"⏸️ Enrollment of Division {division} paused.")
+                break
+    finally:
+        results.close()
+
+    people = _save_checkpoint(division, images, rows, legacy, manifest)
+    remaining = len(pending) - encoded
+    _set_status(division, state="ready" if remaining == 0 else "partial", pending=remaining, people=people)
+    print(f"💾 Saved local encodings for Division {division} to {ENCODINGS_PATH} "
+          f"({encoded} encoded, {len(removed)} removed, {remaining} pending)")
+    return remaining == 0
+
+
+def list_divisions():
+    if not os.path.isdir(DATASET_PATH):
+        return []
+    return sorted(entry.name for entry in os.scandir(DATASET_PATH) if entry.is_dir())
+
+
+# Background enrollment. A single thread walks the divisions between sessions;
+# the heavy lifting happens in the niced worker processes of encode_images.
+
+_status = {}
+_status_lock = threading.Lock()
+_job_thread = None
+_job_lock = threading.Lock()
+_resumed = threading.Event()
+_resumed.set()
+
+
+def _set_status(division, **fields):
+    with _status_lock:
+        status = _status.setdefault(division, {"state": "idle", "pending": None})
+        status.update(fields, updated=time.time())
+
+
+def enrollment_status(division=None):
+    """Returns the enrollment status of one division, or of all divisions."""
+    with _status_lock:
+        if division is not None:
+            return dict(_status.get(division, {"state": "idle", "pending": None}))
+        return {name: dict(status) for name, status in _status.items()}
+
+
+def _paused():
+    return not _resumed.is_set()
+
+
+def _run_background(divisions, workers, budget):
+    queue = list(divisions)
+    while queue:
+        _resumed.wait()
+        if budget is not None and budget <= 0:
+            print("⏸️ Background enrollment budget used up, will resume on the next run.")
+            for division in queue:
+                if enrollment_status(division)["state"] == "queued":
+                    _set_status(division, state="deferred")
+            return
+
+        division = queue[0]
+        start = time.monotonic()
+        try:
+            done = encode_division(division, workers, budget=budget, should_stop=_paused)
+        except Exception as e:
+            # One broken division must not hold up the ones queued after it
+            print(f"❌ Enrollment of Division {division} failed: {e}")
+            _set_status(division, state="failed", error=str(e))
+            done = True
+        if budget is not None:
+            budget -= time.monotonic() - start
+
+        if done:
+            queue.pop(0)
+        elif _paused():
+            _set_status(division, state="paused")
+
+
+def start_background_enrollment(divisions=None, workers=None, budget=None):
+    """
+    Starts enrolling divisions (all of them by default) in a background thread.
+
+    budget defaults to ENROLL_BUDGET seconds of wall time. Does nothing if a
+    job is already running. Returns the thread.
+    """
+    global _job_thread
+    with _job_lock:
+        if _job_thread is not None and _job_thread.is_alive():
+            return _job_thread
+        if divisions is None:
+            divisions = list_divisions()
+        if budget is None:
+            budget = ENROLL_BUDGET or None
+        for division in divisions:
+            _set_status(division, state="queued", error=None)
+        _job_thread = threading.Thread(target=_run_background, args=(divisions, workers, budget), daemon=True)
+        _job_thread.start()
+        return _job_thread
+
+
+def pause_enrollment():
+    """Called when a session starts: frees the CPU, the job checkpoints and waits."""
+    _resumed.clear()
+
+
+def resume_enrollment():
+    """Called when a session ends: lets a paused job continue where it stopped."""
+    _resumed.set()
@@ -1,11 +1,25 @@
 # fetch.py
-from flask import Flask, request, jsonify
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+from enrollment import enrollment_status
+from config import PREVIEW_ENABLED
+from utils.preview import preview_stream, BOUNDARY
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-received_data = None  # Global variable to store the data
+MAX_SESSIONS_KEPT = 100  # finished sessions whose status is still reported
+REQUIRED_FIELDS = ("teacherName", "division", "subject", "date", "time", "semester")
+
+session_queue = queue.Queue()  # session ids waiting for the recognizer
+sessions = OrderedDict()  # session id -> status record
+sessions_lock = threading.Lock()
 
 @app.route('/', methods=['POST'])
 def home():
@@ -13,22 +27,103 @@ def home():
 
 @app.route('/submit-data', methods=['POST'])
 def submit_data():
-    global received_data
     print(request)
     try:
-        data = request.json
-        print(data)
-        received_data = data
-        print(f"Received data: {data}")
-        return jsonify({"success": True, "message": "Data received successfully"})
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({"status": "error", "message": "No session data received"}), 400
+        if not isinstance(data, dict):
+            return jsonify({"status": "error", "message": "Session data must be a JSON object"}), 400
+        missing = [field for field in REQUIRED_FIELDS if not data.get(field)]
+        if missing:
+            return jsonify({"status": "error", "message": f"Missing fields: {', '.join(missing)}"}), 400
+        session_id = add_session(data)
+        print(f"Received data: {data} (session {session_id})")
+        return jsonify({"success": True, "message": "Data received successfully", "sessionId": session_id})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-def get_data():
-    global received_data
-    return received_data
+@app.route('/status/<session_id>', methods=['GET'])
+def get_session_status(session_id):
+    status = session_status(session_id)
+    if status is None:
+        return jsonify({"status": "error", "message": "Unknown session"}), 404
+    return jsonify(status)
+
+@app.route('/enrollment-status', methods=['GET'])
+def get_enrollment_status():
+    division = request.args.get('division')
+    return jsonify(enrollment_status(division))
+
+@app.route('/preview', methods=['GET'])
+def get_preview():
+    if not PREVIEW_ENABLED:
+        return jsonify({"status": "error", "message": "Preview is disabled"}), 404
+    return Response(preview_stream.stream(), mimetype=f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+
+def add_session(data):
+    """Queues a session for the recognizer and returns its id."""
+    session_id = uuid.uuid4().hex
+    with sessions_lock:
+        sessions[session_id] = {"sessionId": session_id, "status": "queued", "data": data,
+                                "queuedAt": time.time(), "startedAt": None, "finishedAt": None,
+                                # pending -> saved once MongoDB has the attendance, retrying while it fails
+                                "persistence": None, "persistedAt": None, "persistError": None}
+        _trim_sessions()
+    session_queue.put(session_id)
+    return session_id
+
+def _trim_sessions():
+    finished = [sid for sid, record in sessions.items() if record["status"] in ("done", "failed")]
+    for sid in finished[:max(len(sessions) - MAX_SESSIONS_KEPT, 0)]:
+        del sessions[sid]
+
+def next_session(timeout=None):
+    """Blocks until a session is submitted. Returns (session_id, data), or (None, None) on timeout."""
+    try:
+        session_id = session_queue.get(timeout=timeout)
+    except queue.Empty:
+        return None, None
+    with sessions_lock:
+        return session_id, sessions[session_id]["data"]
+
+def update_session(session_id, **fields):
+    """Updates the status record of a session, stamping start/finish times on state changes."""
+    now = time.time()
+    with sessions_lock:
+        record = sessions.get(session_id)
+        if record is None:
+            return
+        if fields.get("status") == "running":
+            record["startedAt"] = now
+        elif fields.get("status") in ("done", "failed"):
+            record["finishedAt"] = now
+        if fields.get("persistence") == "saved":
+            record["persistedAt"] = now
+        record.update(fields)
+
+def session_status(session_id):
+    with sessions_lock:
+        record = sessions.get(session_id)
+        if record is None:
+            return None
+        status = {key: value for key, value in record.items() if key != "data"}
+
+    # Timings in seconds, so far for sessions that are still queued or running
+    now = time.time()
+    started = status["startedAt"]
+    finished = status["finishedAt"]
+    status["waitSeconds"] = (started or now) - status["queuedAt"]
+    status["runSeconds"] = (finished or now) - started if started else None
+    status["queuePosition"] = _queue_position(session_id)
+    return status
+
+def _queue_position(session_id):
+    with session_queue.mutex:
+        waiting = list(session_queue.queue)
+    return waiting.index(session_id) + 1 if session_id in waiting else None
 
 def run_server():
-    app.run(host='localhost', port=8000, debug=False)
-    
+    app.run(host='localhost', port=8000, debug=False, threaded=True)
+
 #run_server()
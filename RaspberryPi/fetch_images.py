@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
 import os
+import time
+import tempfile
 import firebase_admin
 from firebase_admin import credentials, firestore
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import argparse
 import logging
 
+from config import DOWNLOAD_WORKERS, DOWNLOAD_TIMEOUT, DOWNLOAD_RETRIES, DOWNLOAD_BACKOFF
+
+# os.umask can only be read by setting it, so read it once before any download thread runs
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 class CloudinaryFirebaseDownloader:
     def __init__(self, credentials_path, download_dir=None):
         
@@ -53,6 +63,13 @@ class CloudinaryFirebaseDownloader:
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
             self.logger.info(f"Created download directory: {self.download_dir}")
+
+        # One keep-alive connection pool shared by all download threads
+        self.workers = DOWNLOAD_WORKERS
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
     
     def parse_email_for_path(self, email):
         """
@@ -209,8 +226,60 @@ class CloudinaryFirebaseDownloader:
             self.logger.error(f"Error getting all user IDs: {e}")
             return set()
     
+    def download_image(self, image_url, filepath):
+        """
+        Downloads one image with retries and exponential backoff. The image is
+        written to a hidden temp file renamed into place once complete, so an
+        interrupted run never leaves a truncated JPEG behind.
+        """
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(filepath), prefix=".", suffix=".part")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    with self.session.get(image_url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                        response.raise_for_status()
+                        for chunk in response.iter_content(chunk_size=8192):
+                            f.write(chunk)
+                # mkstemp creates the file 0600; give it the mode open() would have
+                os.chmod(temp_path, 0o666 & ~UMASK)
+                os.replace(temp_path, filepath)
+                return
+            except requests.RequestException as e:
+                os.remove(temp_path)
+                status = e.response.status_code if e.response is not None else None
+                # Client errors other than rate limiting will not go away by retrying
+                if attempt == DOWNLOAD_RETRIES or (status is not None and 400 <= status < 500 and status != 429):
+                    raise
+                delay = DOWNLOAD_BACKOFF * 2 ** attempt
+                self.logger.warning(f"Download of {image_url} failed ({e}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+    def _download_job(self, job):
+        image_url, filepath = job
+        try:
+            self.download_image(image_url, filepath)
+            self.logger.info(f"Downloaded image: {filepath}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Failed to download image {image_url}: {e}")
+            return False
+
     def download_user_images(self, user_id):
-       
+        """Downloads the images of one user on a pool of DOWNLOAD_WORKERS threads."""
+        jobs, existing = self.user_image_jobs(user_id)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            download_count = existing + sum(executor.map(self._download_job, jobs))
+        self.logger.info(f"Downloaded {download_count} images for user {user_id}")
+        return download_count
+
+    def user_image_jobs(self, user_id):
+        """
+        Looks up a user's images. Returns ([(image_url, filepath), ...], existing):
+        the images still to download and how many are already on disk.
+        """
         # Retrieve the user data using the email-based path
         try:
             user_data = self.find_user_by_id(user_id)
@@ -246,8 +315,9 @@ class CloudinaryFirebaseDownloader:
             self.logger.info(f"Found {len(images)} images for user {user_id}")
         except Exception as e:
             self.logger.error(f"Error retrieving images for {user_id}: {e}")
-            return 0
+            return [], 0
         
+        jobs = []
         download_count = 0
         for image in images:
             image_data = image.to_dict()
@@ -278,23 +348,9 @@ class CloudinaryFirebaseDownloader:
                 download_count += 1
                 continue
                 
-            # Download the image
-            try:
-                response = requests.get(image_url, stream=True)
-                response.raise_for_status()
-                
-                with open(filepath, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                
-                self.logger.info(f"Downloaded image: {filepath}")
-                download_count += 1
-                
-            except Exception as e:
-                self.logger.error(f"Failed to download image {image_url}: {e}")
+            jobs.append((image_url, filepath))
             
-        self.logger.info(f"Downloaded {download_count} images for user {user_id}")
-        return download_count
+        return jobs, download_count
     
     def download_all_users_images(self):
         """
@@ -303,26 +359,22 @@ class CloudinaryFirebaseDownloader:
         Returns:
             dict: Dictionary with user IDs as keys and number of downloads as values
         """
-        results = {}
-        
         # Get all dataset collections
         datasets_ref = self.db.collection("datasets")
-        user_collections = datasets_ref.list_documents()
-        # print("datasets_ref")
-        # print(datasets_ref)
-        # print("user_collections")
-        # print(user_collections)
-        
-        for user_ref in user_collections:
-            user_id = user_ref.id
-            # print("user_ref")
-            # print(user_ref)
-            # print("user_id")
-            # print(user_id)
-            self.logger.info(f"Processing user: {user_id}")
-            download_count = self.download_user_images(user_id)
-            results[user_id] = download_count
-        
+        user_ids = [user_ref.id for user_ref in datasets_ref.list_documents()]
+        self.logger.info(f"Processing {len(user_ids)} users")
+
+        # Look up every user, then download all their images, on the same bounded pool
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            user_jobs = list(executor.map(self.user_image_jobs, user_ids))
+            results = {user_id: existing for user_id, (_, existing) in zip(user_ids, user_jobs)}
+            downloads = [(user_id, executor.submit(self._download_job, job))
+                         for user_id, (jobs, _) in zip(user_ids, user_jobs) for job in jobs]
+            for user_id, future in downloads:
+                results[user_id] += future.result()
+
+        for user_id, download_count in results.items():
+            self.logger.info(f"Downloaded {download_count} images for user {user_id}")
         return results
 
     def get_sub_collections(self, doc_path):
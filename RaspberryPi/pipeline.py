@@ -0,0 +1,369 @@
+"""
+Pipelined, multi-core frame processing.
+
+    capture -> [preprocess + detect] -> [encode] -> match -> vote
+               worker processes        worker processes    main process
+
+The CPU heavy stages run in worker processes so the Pi's cores work on
+different frames at the same time. Captured frames are written into a
+shared-memory FrameRing (utils/frame_ring.py) that detect workers read in
+place; after that, stages are connected by small bounded queues. With a
+dual-stream camera a second ring carries the low resolution luma stream:
+detection runs on that, and only the face crops are cut from the full
+resolution frame. When a
+stage falls behind, frames are dropped instead of queued: a detect worker
+always claims the newest frame, skips frames that are already older than
+max_frame_age, and the queues keep only their newest items. Encode workers
+receive padded face crops rather than whole frames to keep inter-process
+traffic small, and with TRACK_FACES they track faces across frames
+(utils/tracker.py) so a face that stays put reuses its encoding instead of
+running the dlib encoder again. Every worker runs its dlib model once as
+soon as it starts, so the first session does not wait for it.
+
+Matching is a single matrix product (utils/matcher.py) and voting is cheap,
+so both stay in the process that owns the session and the gallery.
+"""
+import time
+import queue
+import multiprocessing as mp
+from collections import namedtuple
+
+from config import (PIPELINE_DETECT_WORKERS, PIPELINE_ENCODE_WORKERS, PIPELINE_QUEUE_SIZE, PIPELINE_MAX_FRAME_AGE,
+                    CAMERA_RESOLUTION, DETECT_SCALE, TRACK_FACES, PREPROCESS_PROFILE)
+from utils.frame_ring import FrameRing
+from utils.tracker import FaceTracker, is_uncertain
+
+# seq and timestamp identify the source frame, track_ids holds one id per
+# face (None without tracking), fresh tells per face whether its encoding was
+# computed from this frame (False if reused from its track) and timings the
+# seconds the worker stages spent on it
+FrameResult = namedtuple("FrameResult", ["seq", "timestamp", "face_locations", "face_encodings", "track_ids", "timings",
+                                         "fresh"])
+
+CROP_PADDING = 0.5  # margin around each face box, as a fraction of its size, kept for landmarking
+
+
+def _put_dropping_oldest(q, item):
+    """Puts item on a bounded queue, discarding the oldest item if it is full. Returns False if one was dropped."""
+    try:
+        q.put_nowait(item)
+        return True
+    except queue.Full:
+        pass
+    try:
+        q.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        pass
+    return False
+
+
+def crop_faces(rgb_frame, face_locations, padding=CROP_PADDING):
+    """Returns [(crop, (top, right, bottom, left) inside the crop)] for every face."""
+    height, width = rgb_frame.shape[:2]
+    crops = []
+    for top, right, bottom, left in face_locations:
+        pad_y = int((bottom - top) * padding)
+        pad_x = int((right - left) * padding)
+        y0, y1 = max(top - pad_y, 0), min(bottom + pad_y, height)
+        x0, x1 = max(left - pad_x, 0), min(right + pad_x, width)
+        crops.append((rgb_frame[y0:y1, x0:x1].copy(), (top - y0, right - x0, bottom - y0, left - x0)))
+    return crops
+
+
+def _detect_luma(ring, luma_ring, seq, luma, timings, profile):
+    """Detects on the luma frame seq and cuts the faces from the main frame. Returns (locations, crops) or None."""
+    from recognition import prepare_frame, locate_faces, prepare_crops, scale_locations
+
+    gray = prepare_frame(luma, timings, profile, rgb=False)  # the first step that copies out of the ring
+    if not luma_ring.is_current(seq):
+        return None
+    frame = ring.get(seq)
+    if frame is None:
+        return None
+
+    # The lores stream is already the detection resolution. Its aspect ratio
+    # may differ from the main stream's, so each axis is scaled on its own
+    scale = (gray.shape[0] / frame.shape[0], gray.shape[1] / frame.shape[1])
+    face_locations = scale_locations(locate_faces(gray, timings, 1), scale, frame.shape)
+    crops = crop_faces(frame, face_locations)
+    if not ring.is_current(seq):
+        return None
+    return face_locations, prepare_crops(crops, timings, profile)
+
+
+def _detect_worker(ring, luma_ring, active, stopping, detections, max_frame_age, detect_scale, profile):
+    from recognition import prepare_frame, locate_faces, prepare_faces, warm_up
+
+    warm_up(encode=False)
+    while not stopping.is_set():
+        if not active.wait(timeout=0.5):
+            continue
+        seq, timestamp, frame = (luma_ring or ring).claim(timeout=0.5)
+        if seq is None or time.time() - timestamp > max_frame_age:
+            continue  # nothing new, or stale
+
+        timings = {}
+        if luma_ring is not None:
+            detected = _detect_luma(ring, luma_ring, seq, frame, timings, profile)
+            if detected is not None:
+                _put_dropping_oldest(detections, (seq, timestamp, detected[0], detected[1], timings))
+            continue
+
+        rgb_frame = prepare_frame(frame, timings, profile)  # the first step that copies out of the ring
+        if not ring.is_current(seq):
+            continue  # the capture thread reused the slot while we were reading it
+        face_locations = locate_faces(rgb_frame, timings, detect_scale)
+        prepare_faces(rgb_frame, face_locations, timings, profile)
+        _put_dropping_oldest(detections, (seq, timestamp, face_locations, crop_faces(rgb_frame, face_locations), timings))
+
+
+def _apply_feedback(feedback, tracker):
+    while True:
+        try:
+            message = feedback.get_nowait()
+        except queue.Empty:
+            return
+        if message[0] == "reset":
+            tracker.reset()
+        elif message[0] == "uncertain":
+            for track_id in message[1]:
+                tracker.mark_uncertain(track_id)
+
+
+def _encode_worker(detections, results, feedback, track):
+    from recognition import encode_faces, warm_up
+
+    warm_up(detect=False)
+    tracker = FaceTracker() if track else None
+    last_seq = 0
+    while True:
+        item = detections.get()
+        if item is None:
+            break
+        seq, timestamp, face_locations, crops, timings = item
+
+        if tracker is None:
+            face_encodings = []
+            for crop, box in crops:
+                face_encodings.extend(encode_faces(crop, [box], timings))
+            _put_dropping_oldest(results, FrameResult(seq, timestamp, face_locations, face_encodings, [None] * len(crops),
+                                                      timings, [True] * len(crops)))
+            continue
+
+        _apply_feedback(feedback, tracker)
+        if seq < last_seq:
+            continue  # overtaken by a newer frame from another detect worker
+        last_seq = seq
+
+        track_ids, needs_encoding = tracker.update(face_locations, timestamp)
+        fresh = [False] * len(face_locations)
+        for index in needs_encoding:
+            crop, box = crops[index]
+            tracker.store(track_ids[index], encode_faces(crop, [box], timings)[0], timestamp)
+            fresh[index] = True
+        _put_dropping_oldest(results, FrameResult(seq, timestamp, face_locations, tracker.encodings(track_ids), track_ids,
+                                                  timings, fresh))
+
+
+class FramePipeline:
+    def __init__(self, detect_workers=None, encode_workers=None, queue_size=None, max_frame_age=None, frame_shape=None,
+                 detect_scale=None, track=None, profile=None, luma_shape=None):
+        self.detect_workers = detect_workers or PIPELINE_DETECT_WORKERS
+        self.encode_workers = encode_workers or PIPELINE_ENCODE_WORKERS
+        self.queue_size = queue_size or PIPELINE_QUEUE_SIZE
+        self.max_frame_age = max_frame_age or PIPELINE_MAX_FRAME_AGE
+        self.frame_shape = frame_shape or (CAMERA_RESOLUTION[1], CAMERA_RESOLUTION[0], 3)
+        self.detect_scale = detect_scale or DETECT_SCALE
+        self.profile = profile or PREPROCESS_PROFILE
+        # Tracks have to see every frame, so tracking needs a single encode worker
+        self.track = (TRACK_FACES if track is None else track) and self.encode_workers == 1
+        self.luma_shape = luma_shape  # (height, width) of the camera's lores stream, None without one
+        self.processes = []
+        self.ring = None
+        self.luma_ring = None
+        self.submitted = 0
+
+    def start(self, active=True):
+        """
+        Starts the workers. An inactive pipeline accepts frames but leaves
+        them unprocessed until activate() is called.
+        """
+        if self.processes:
+            return self
+        self.ring = FrameRing(self.frame_shape)
+        if self.luma_shape:
+            self.luma_ring = FrameRing(self.luma_shape)
+        self.active = mp.Event()
+        self.stopping = mp.Event()
+        self.detections = mp.Queue(self.queue_size)
+        self.results = mp.Queue(self.queue_size * 2)
+        self.feedback = mp.Queue()
+        if active:
+            self.active.set()
+
+        for _ in range(self.detect_workers):
+            self.processes.append(mp.Process(target=_detect_worker, daemon=True,
+                                             args=(self.ring, self.luma_ring, self.active, self.stopping, self.detections, self.max_frame_age,
+                                                   self.detect_scale, self.profile)))
+        for _ in range(self.encode_workers):
+            self.processes.append(mp.Process(target=_encode_worker, daemon=True,
+                                             args=(self.detections, self.results, self.feedback, self.track)))
+        for process in self.processes:
+            process.start()
+        print(f"🏭 Frame pipeline started ({self.detect_workers} detect, {self.encode_workers} encode workers"
+              f"{', tracking faces' if self.track else ''})")
+        return self
+
+    def submit(self, frame, timestamp=None, block=False, luma=None):
+        """
+        Writes a BGR frame into the ring and returns its sequence number.
+        A pipeline with a luma_shape also needs the frame's luma image.
+
+        Without block, frames the workers have not claimed by the time a
+        newer one arrives are skipped, so the newest frame is always
+        processed next. With block, waits until the previous frame was
+        claimed so none is skipped.
+        """
+        self.submitted += 1
+        if self.luma_ring is None:
+            return self.ring.write(frame, timestamp, block)
+
+        if block:
+            self.luma_ring.wait_claimed()
+        timestamp = time.time() if timestamp is None else timestamp
+        # Main first: once the luma frame can be claimed, its main frame is there
+        seq = self.ring.write(frame, timestamp)
+        self.luma_ring.write(luma, timestamp)
+        return seq
+
+    @property
+    def dropped(self):
+        ring = self.luma_ring or self.ring
+        return ring.skipped.value if ring is not None else 0
+
+    def review(self, result, matches):
+        """Has the encode worker re-encode tracked faces whose match was weak."""
+        uncertain = [track_id for track_id, match in zip(result.track_ids, matches)
+                     if track_id is not None and is_uncertain(match)]
+        if uncertain:
+            self.feedback.put(("uncertain", uncertain))
+
+    def frame(self, seq):
+        """Returns a copy of frame seq if it is still in the ring, else None."""
+        view = self.ring.get(seq)
+        if view is None:
+            return None
+        frame = view.copy()
+        return frame if self.ring.is_current(seq) else None
+
+    def activate(self):
+        """Starts processing frames written from now on, e.g. when a session starts."""
+        self.drain()
+        self.active.set()
+
+    def deactivate(self):
+        self.active.clear()
+        self.drain()
+
+    def get_result(self, timeout=None):
+        """Returns the next FrameResult, or None if none arrives within timeout."""
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        """Discards waiting frames and results and resets the counters, e.g. between sessions."""
+        self.submitted = 0
+        self.ring.skip_to_latest()
+        if self.luma_ring is not None:
+            self.luma_ring.skip_to_latest()
+        self.feedback.put(("reset",))  # tracks from an earlier session mean nothing now
+        for q in (self.detections, self.results):
+            while True:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    break
+
+    def stop(self):
+        self.stopping.set()
+        self.drain()
+        for _ in range(self.encode_workers):
+            self.detections.put(None)
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        for ring in (self.ring, self.luma_ring):
+            if ring is not None:
+                ring.close(unlink=True)
+        self.ring = self.luma_ring = None
+
+
+class Voter:
+    """
+    Confirms a person once they are matched in confirm_frames processed
+    frames with a freshly computed encoding, with no gap of cooldown_frames
+    frames in between.
+    """
+
+    def __init__(self, confirm_frames=10, cooldown_frames=5, verbose=True):
+        self.confirm_frames = confirm_frames
+        self.cooldown_frames = cooldown_frames
+        self.verbose = verbose  # print every match and confirmation
+        self.recognition_count = {}
+        self.cooldown_counter = {}
+        self.confirmed = set()
+        self.accuracy_log = {}
+
+    def update(self, matches, fresh=None):
+        """
+        Counts the matches of one processed frame. Returns the names confirmed by it.
+
+        fresh tells per match whether its encoding was computed from this
+        frame. Only fresh matches count toward confirm_frames, so one encoding
+        reused by the tracker cannot confirm a person alone; a reused match
+        only keeps the person from cooling down.
+        """
+        newly_confirmed = []
+        current_frame_names = []
+
+        for index, match in enumerate(matches):
+            name = match.name
+            current_frame_names.append(name)
+            if name == "Unknown":
+                continue
+
+            self.cooldown_counter[name] = 0
+            if fresh is not None and not fresh[index]:
+                continue
+            self.recognition_count[name] = self.recognition_count.get(name, 0) + 1
+            if self.verbose:
+                print(f"? Matched: {name}, Count: {self.recognition_count[name]}, Distance: {match.distance:.4f}")
+            self.accuracy_log.setdefault(name, []).append(match.distance)
+
+            if self.recognition_count[name] >= self.confirm_frames and name not in self.confirmed:
+                if self.verbose:
+                    print(f"? Confirmed: {name} recognized consistently.")
+                self.confirmed.add(name)
+                self.recognition_count[name] = self.confirm_frames
+                newly_confirmed.append(name)
+
+        for registered_name in list(self.recognition_count.keys()):
+            if registered_name in self.confirmed:
+                continue
+            if registered_name not in current_frame_names:
+                self.cooldown_counter[registered_name] = self.cooldown_counter.get(registered_name, 0) + 1
+                if self.cooldown_counter[registered_name] >= self.cooldown_frames:
+                    self.recognition_count[registered_name] = 0
+                    self.cooldown_counter[registered_name] = 0
+            else:
+                self.cooldown_counter[registered_name] = 0
+
+        return newly_confirmed
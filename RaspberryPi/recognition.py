@@ -0,0 +1,175 @@
+"""
+The per-frame recognition path: preprocess -> detect -> encode -> match.
+
+Shared by the live recognizer (encode_recognition_rpi.py), video replay
+(recog_photo.py) and the offline benchmark (benchmark.py) so that what is
+measured is what runs in the classroom. Frames are BGR, as delivered by the
+Pi camera and by OpenCV.
+
+Preprocessing is the configurable step chain of utils/preprocess.py. HOG
+detection cost grows with the number of pixels, so faces are located on a
+copy of the frame resized by DETECT_SCALE and the boxes are mapped back to
+the full frame, where landmarking and encoding run at full resolution.
+"""
+import time
+import cv2
+import numpy as np
+import face_recognition
+
+from config import DETECT_SCALE
+from utils.preprocess import get_preprocessor
+from utils.tracker import is_uncertain
+
+STAGES = ("preprocess", "detect", "encode", "match")
+
+
+def prepare_frame(frame, timings=None, profile=None, rgb=True):
+    """
+    Runs the frame steps of a preprocessing profile, returning the RGB frame
+    detection and encoding work on. Without rgb, a gray frame (such as the
+    camera's luma stream) stays single channel, which is all HOG needs.
+    """
+    t0 = time.perf_counter()
+    rgb_frame = get_preprocessor(profile).apply(frame, timings, rgb)
+    _record(timings, preprocess=time.perf_counter() - t0)
+    return rgb_frame
+
+
+def prepare_faces(rgb_frame, face_locations, timings=None, profile=None):
+    """Runs the ROI steps of a preprocessing profile on the face regions, in place."""
+    preprocessor = get_preprocessor(profile)
+    if not preprocessor.roi_steps or not face_locations:
+        return
+    t0 = time.perf_counter()
+    preprocessor.apply_roi(rgb_frame, face_locations, timings)
+    if timings is not None and timings.get("preprocess"):
+        timings["preprocess"][-1] += time.perf_counter() - t0  # still part of preprocessing this frame
+
+
+def prepare_crops(crops, timings=None, profile=None):
+    """
+    Preprocesses [(BGR crop, box inside the crop)] taken from a full
+    resolution frame that detection never saw. Returns them as RGB crops
+    ready for encoding.
+    """
+    preprocessor = get_preprocessor(profile)
+    t0 = time.perf_counter()
+    prepared = []
+    for crop, box in crops:
+        rgb_crop = preprocessor.apply(crop, timings)
+        preprocessor.apply_roi(rgb_crop, [box], timings)
+        prepared.append((rgb_crop, box))
+    if timings is not None and timings.get("preprocess"):
+        timings["preprocess"][-1] += time.perf_counter() - t0
+    return prepared
+
+
+def scale_locations(face_locations, scale, shape):
+    """
+    Maps (top, right, bottom, left) boxes found on a frame resized by scale
+    back onto a frame of shape. scale is one factor, or (y, x) factors for a
+    frame resized to another aspect ratio.
+    """
+    height, width = shape[:2]
+    scale_y, scale_x = scale if isinstance(scale, tuple) else (scale, scale)
+    return [(max(int(top / scale_y), 0), min(int(round(right / scale_x)), width),
+             min(int(round(bottom / scale_y)), height), max(int(left / scale_x), 0))
+            for top, right, bottom, left in face_locations]
+
+
+def locate_faces(rgb_frame, timings=None, scale=None):
+    """Finds faces on rgb_frame resized by scale. Boxes are in full frame coordinates."""
+    scale = scale or DETECT_SCALE
+    t0 = time.perf_counter()
+    if scale == 1:
+        face_locations = face_recognition.face_locations(rgb_frame, model="hog")
+    else:
+        small_frame = cv2.resize(rgb_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        face_locations = scale_locations(face_recognition.face_locations(small_frame, model="hog"), scale, rgb_frame.shape)
+    _record(timings, detect=time.perf_counter() - t0)
+    return face_locations
+
+
+def detect_faces(frame, timings=None, scale=None, profile=None):
+    """Preprocesses a BGR frame and finds faces. Returns (rgb_frame, face_locations)."""
+    rgb_frame = prepare_frame(frame, timings, profile)
+    face_locations = locate_faces(rgb_frame, timings, scale)
+    prepare_faces(rgb_frame, face_locations, timings, profile)
+    return rgb_frame, face_locations
+
+
+def encode_faces(rgb_frame, face_locations, timings=None):
+    """Returns one 128-d encoding per face location."""
+    t0 = time.perf_counter()
+    face_encodings = face_recognition.face_encodings(rgb_frame, face_locations, num_jitters=1)
+    _record(timings, encode=time.perf_counter() - t0)
+    return face_encodings
+
+
+def match_faces(matcher, face_encodings, timings=None):
+    t0 = time.perf_counter()
+    matches = matcher.match(face_encodings)
+    _record(timings, match=time.perf_counter() - t0)
+    return matches
+
+
+def warm_up(detect=True, encode=True):
+    """Runs the dlib detector and/or encoder once on a blank image, so the first real frame does not pay for it."""
+    blank = np.zeros((120, 120, 3), dtype=np.uint8)
+    if detect:
+        face_recognition.face_locations(blank, model="hog")
+    if encode:
+        face_recognition.face_encodings(blank, [(10, 110, 110, 10)], num_jitters=1)
+
+
+def _record(timings, **stages):
+    if timings is not None:
+        for stage, seconds in stages.items():
+            timings.setdefault(stage, []).append(seconds)
+
+
+def stage_seconds(timings):
+    """Total seconds recorded for the main stages (per-step entries like preprocess.clahe are already part of them)."""
+    return sum(sum(timings.get(stage, ())) for stage in STAGES)
+
+
+def encode_tracked(rgb_frame, face_locations, tracker, timestamp, timings=None):
+    """
+    Like encode_faces, but only encodes faces the tracker has no fresh
+    encoding for. Returns (track_ids, face_encodings, fresh), fresh telling
+    per face whether its encoding was computed from this frame.
+    """
+    track_ids, needs_encoding = tracker.update(face_locations, timestamp)
+    fresh = [False] * len(face_locations)
+    if needs_encoding:
+        encodings = encode_faces(rgb_frame, [face_locations[i] for i in needs_encoding], timings)
+        for index, encoding in zip(needs_encoding, encodings):
+            tracker.store(track_ids[index], encoding, timestamp)
+            fresh[index] = True
+    return track_ids, tracker.encodings(track_ids), fresh
+
+
+def process_frame(frame, matcher, timings=None, detect_scale=None, tracker=None, timestamp=None, profile=None):
+    """
+    Runs one BGR frame through the whole path.
+
+    Returns (face_locations, matches, fresh). If timings is a dict, the
+    seconds spent in every stage are appended to timings[stage]. With a
+    FaceTracker, faces tracked from earlier frames reuse their encoding;
+    timestamp (in seconds) decides when those encodings are stale, and fresh
+    tells per face whether its encoding was computed from this frame (the
+    flags pipeline.Voter counts by). profile names the
+    preprocessing profile, PREPROCESS_PROFILE by default.
+    """
+    rgb_frame, face_locations = detect_faces(frame, timings, detect_scale, profile)
+    if tracker is None:
+        face_encodings = encode_faces(rgb_frame, face_locations, timings)
+        return face_locations, match_faces(matcher, face_encodings, timings), [True] * len(face_locations)
+
+    track_ids, face_encodings, fresh = encode_tracked(rgb_frame, face_locations, tracker,
+                                               time.time() if timestamp is None else timestamp, timings)
+    matches = match_faces(matcher, face_encodings, timings)
+    for track_id, match in zip(track_ids, matches):
+        if is_uncertain(match):
+            tracker.mark_uncertain(track_id)
+    return face_locations, matches, fresh
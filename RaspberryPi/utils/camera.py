@@ -0,0 +1,122 @@
+"""
+Camera sources for the live recognizer.
+
+read() returns (frame, luma): frame is the full resolution BGR main stream,
+luma the gray low resolution stream detection runs on (None for sources
+without one).
+
+    PiCameraSource    Picamera2 with a CAMERA_RESOLUTION RGB888 main stream
+                      and, if CAMERA_LORES_RESOLUTION is set, a YUV420 lores
+                      stream of which only the luma plane is used.
+    FakeCameraSource  Replays a video file (or an OpenCV device) in a loop at
+                      its own frame rate and derives the lores luma the same
+                      way, for tests and development without a Pi.
+
+open_camera() picks one from CAMERA_SOURCE.
+"""
+import time
+
+import cv2
+
+from config import CAMERA_SOURCE, CAMERA_RESOLUTION, CAMERA_LORES_RESOLUTION
+
+
+class PiCameraSource:
+    def __init__(self, resolution=None, lores_resolution=None):
+        self.resolution = tuple(resolution or CAMERA_RESOLUTION)
+        self.lores_resolution = tuple(lores_resolution or CAMERA_LORES_RESOLUTION or ()) or None
+        self.picam2 = None
+
+    @property
+    def frame_shape(self):
+        return (self.resolution[1], self.resolution[0], 3)
+
+    @property
+    def luma_shape(self):
+        return (self.lores_resolution[1], self.lores_resolution[0]) if self.lores_resolution else None
+
+    def start(self):
+        from picamera2 import Picamera2
+
+        self.picam2 = Picamera2()
+        streams = {"main": {"size": self.resolution, "format": "RGB888"}}
+        if self.lores_resolution:
+            streams["lores"] = {"size": self.lores_resolution, "format": "YUV420"}
+        self.picam2.configure(self.picam2.create_video_configuration(**streams))
+        self.picam2.start()
+        return self
+
+    def read(self):
+        if not self.lores_resolution:
+            return self.picam2.capture_array(), None
+
+        request = self.picam2.capture_request()
+        try:
+            frame = request.make_array("main")
+            # YUV420 comes as one (height * 3 / 2, width) plane, the first height rows are luma
+            width, height = self.lores_resolution
+            luma = request.make_array("lores")[:height, :width]
+        finally:
+            request.release()
+        return frame, luma
+
+    def stop(self):
+        if self.picam2 is not None:
+            self.picam2.stop()
+            self.picam2 = None
+
+
+class FakeCameraSource:
+    def __init__(self, source, resolution=None, lores_resolution=None, loop=True):
+        self.source = source
+        self.resolution = tuple(resolution or CAMERA_RESOLUTION)
+        self.lores_resolution = tuple(lores_resolution or CAMERA_LORES_RESOLUTION or ()) or None
+        self.loop = loop
+        self.capture = None
+
+    frame_shape = PiCameraSource.frame_shape
+    luma_shape = PiCameraSource.luma_shape
+
+    def start(self):
+        self.capture = cv2.VideoCapture(self.source)
+        if not self.capture.isOpened():
+            raise RuntimeError(f"Could not open fake camera source {self.source}")
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.interval = 1.0 / fps if fps and fps > 0 else 1.0 / 30
+        self.next_time = time.monotonic()
+        return self
+
+    def read(self):
+        # Paced like a real camera, so the scheduler and pipeline see realistic timing
+        delay = self.next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_time = max(self.next_time, time.monotonic() - self.interval) + self.interval
+
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        if not ret:
+            return None, None
+
+        if frame.shape[1::-1] != self.resolution:
+            frame = cv2.resize(frame, self.resolution, interpolation=cv2.INTER_AREA)
+        luma = None
+        if self.lores_resolution:
+            luma = cv2.cvtColor(cv2.resize(frame, self.lores_resolution, interpolation=cv2.INTER_AREA),
+                                cv2.COLOR_BGR2GRAY)
+        return frame, luma
+
+    def stop(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+def open_camera(source=None):
+    """Returns the configured camera source, not started yet."""
+    source = CAMERA_SOURCE if source is None else source
+    if source == "picamera2":
+        return PiCameraSource()
+    return FakeCameraSource(int(source) if str(source).isdigit() else source)
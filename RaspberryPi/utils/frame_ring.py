@@ -0,0 +1,139 @@
+"""
+Fixed-size ring buffer of camera frames in shared memory.
+
+The capture thread writes every frame into the next slot; worker processes
+read frames straight out of shared memory, so nothing is pickled or copied
+on the way. Every slot carries the sequence number, timestamp and size of
+the frame it holds; frames may be smaller than the ring's shape.
+
+Workers claim frames: a claim always returns the newest frame that nobody
+has claimed yet (older unclaimed frames are skipped as stale), so no frame
+is processed twice. Claims and waits sleep on a shared condition variable
+instead of polling.
+
+A slot is reused slots frames later. Readers that hold on to a view should
+check is_current(seq) once they have copied what they need out of it.
+"""
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config import FRAME_RING_SLOTS
+
+
+class FrameRing:
+    def __init__(self, shape, dtype=np.uint8, slots=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots or FRAME_RING_SLOTS
+
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * (24 + frame_bytes))
+
+        self.cond = mp.Condition()
+        self.latest = mp.RawValue("q", 0)  # seq of the newest complete frame
+        self.claimed = mp.RawValue("q", 0)  # seq of the newest claimed frame
+        self.skipped = mp.RawValue("q", 0)  # frames never claimed because a newer one was
+        self._attach()
+        self.seqs[:] = 0
+
+    def _attach(self):
+        buf = self.shm.buf
+        self.seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=buf, offset=0)
+        self.stamps = np.ndarray((self.slots,), dtype=np.float64, buffer=buf, offset=8 * self.slots)
+        self.sizes = np.ndarray((self.slots, 2), dtype=np.int32, buffer=buf, offset=16 * self.slots)
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=self.dtype, buffer=buf, offset=24 * self.slots)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("seqs", "stamps", "sizes", "frames"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    def write(self, frame, timestamp=None, block=False):
+        """
+        Copies a frame into the next slot and wakes up waiting readers.
+
+        With block, waits until the previous frame has been claimed, so a
+        reader that keeps up never misses a frame (used for replays).
+        Returns the frame's sequence number.
+        """
+        height, width = frame.shape[:2]
+        if height > self.shape[0] or width > self.shape[1] or frame.shape[2:] != self.shape[2:]:
+            raise ValueError(f"frame of shape {frame.shape} does not fit a ring of {self.shape}")
+
+        if block:
+            self.wait_claimed()
+        with self.cond:
+            seq = self.latest.value + 1
+            slot = seq % self.slots
+            self.seqs[slot] = -1  # being written
+
+        self.frames[slot, :height, :width] = frame
+
+        with self.cond:
+            self.stamps[slot] = time.time() if timestamp is None else timestamp
+            self.sizes[slot] = (height, width)
+            self.seqs[slot] = seq
+            self.latest.value = seq
+            self.cond.notify_all()
+        return seq
+
+    def wait_claimed(self, timeout=None):
+        """Waits until every frame written so far has been claimed. Returns False on timeout."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.claimed.value >= self.latest.value, timeout)
+
+    def _view(self, seq):
+        slot = seq % self.slots
+        height, width = self.sizes[slot]
+        return seq, float(self.stamps[slot]), self.frames[slot, :height, :width]
+
+    def claim(self, timeout=None):
+        """
+        Returns (seq, timestamp, frame view) of the newest unclaimed frame,
+        or (None, None, None) if no new frame arrives within timeout.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.latest.value > self.claimed.value, timeout):
+                return None, None, None
+            seq = self.latest.value
+            self.skipped.value += seq - self.claimed.value - 1
+            self.claimed.value = seq
+            self.cond.notify_all()
+            return self._view(seq)
+
+    def wait_newer(self, after_seq, timeout=None):
+        """Like claim, but only observes: returns the newest frame after after_seq without claiming it."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.latest.value > after_seq, timeout):
+                return None, None, None
+            return self._view(self.latest.value)
+
+    def get(self, seq):
+        """Returns a view of frame seq, or None if its slot has been reused."""
+        if not self.is_current(seq):
+            return None
+        return self._view(seq)[2]
+
+    def is_current(self, seq):
+        return self.seqs[seq % self.slots] == seq
+
+    def skip_to_latest(self):
+        """Marks everything written so far as claimed, e.g. when a session starts."""
+        with self.cond:
+            self.claimed.value = self.latest.value
+            self.skipped.value = 0
+            self.cond.notify_all()
+
+    def close(self, unlink=False):
+        self.seqs = self.stamps = self.sizes = self.frames = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
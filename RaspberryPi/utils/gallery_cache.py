@@ -0,0 +1,67 @@
+"""
+In-memory cache of FaceMatcher objects, one per division.
+
+Used by the long running recognition service so back to back sessions do
+not reload and restack the gallery. Entries are evicted least recently used
+first once the cached galleries (matrices, names and label strings) exceed
+max_bytes, and an entry is reloaded when enrollment rewrites the gallery of
+its division.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from database.encoding_store import gallery_version
+from utils.matcher import FaceMatcher
+
+
+class GalleryCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # division -> (version, matcher, nbytes)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _nbytes(matcher):
+        # labels only holds pointers; every row of a person points to the same string
+        strings = sum(sys.getsizeof(name) for name in set(matcher.labels))
+        arrays = (matcher.matrix, matcher.sq_norms, matcher.labels, matcher.group_starts, matcher.names)
+        return sum(array.nbytes for array in arrays) + strings
+
+    def get(self, division):
+        """Returns the FaceMatcher of a division, loading it if it is missing or stale."""
+        version = gallery_version(division)
+        with self.lock:
+            entry = self.entries.get(division)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(division)
+                return entry[1]
+
+        # Load outside the lock so other divisions stay available meanwhile
+        matcher = FaceMatcher.from_division(division)
+        if version is None:
+            version = gallery_version(division)  # created by a JSON conversion just now
+
+        with self.lock:
+            self.entries[division] = (version, matcher, self._nbytes(matcher))
+            self.entries.move_to_end(division)
+            self._evict()
+        return matcher
+
+    def _evict(self):
+        total = sum(entry[2] for entry in self.entries.values())
+        while total > self.max_bytes and len(self.entries) > 1:
+            division, entry = self.entries.popitem(last=False)
+            total -= entry[2]
+            print(f"♻️ Evicted gallery of Division {division} from cache.")
+
+    def invalidate(self, division=None):
+        with self.lock:
+            if division is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(division, None)
+
+    def stats(self):
+        with self.lock:
+            return {division: entry[2] for division, entry in self.entries.items()}
@@ -0,0 +1,83 @@
+"""
+Vectorized matching of face encodings against a division gallery.
+
+The gallery is stacked into one N x 128 float32 matrix once, and every face
+found in a frame is scored in a single matrix operation:
+
+    matcher = FaceMatcher.from_division("B")
+    for match in matcher.match(face_encodings):
+        print(match.name, match.distance, match.margin)
+"""
+from collections import namedtuple
+import numpy as np
+
+from database.encoding_store import load_gallery
+
+DEFAULT_TOLERANCE = 0.5
+
+# name is "Unknown" when the best distance is not below the tolerance,
+# label is always the closest enrolled person and margin is how much closer
+# that person is than the runner-up person (inf if there is only one).
+Match = namedtuple("Match", ["name", "label", "distance", "margin"])
+
+
+class FaceMatcher:
+    def __init__(self, matrix, labels, tolerance=DEFAULT_TOLERANCE):
+        labels = np.asarray(labels, dtype=object)
+
+        # Group rows by person so per-person minimums are a single reduceat
+        order = np.argsort(labels, kind="stable")
+        self.labels = labels[order]
+        self.matrix = np.ascontiguousarray(np.asarray(matrix, dtype=np.float32)[order])
+        self.sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self.tolerance = tolerance
+
+        if len(self.labels):
+            starts = np.flatnonzero(np.r_[True, self.labels[1:] != self.labels[:-1]])
+        else:
+            starts = np.empty(0, dtype=np.intp)
+        self.group_starts = starts
+        self.names = self.labels[starts]
+
+    @classmethod
+    def from_division(cls, division, tolerance=DEFAULT_TOLERANCE):
+        matrix, labels = load_gallery(division)
+        return cls(matrix, labels, tolerance)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def distances(self, face_encodings):
+        """Returns the F x N euclidean distance matrix between faces and the gallery."""
+        faces = np.asarray(face_encodings, dtype=np.float32).reshape(-1, self.matrix.shape[1])
+        face_sq = np.einsum("ij,ij->i", faces, faces)
+        sq = face_sq[:, None] + self.sq_norms[None, :] - 2.0 * (faces @ self.matrix.T)
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq)
+
+    def match(self, face_encodings):
+        """Returns one Match per face encoding, in the same order."""
+        if len(face_encodings) == 0:
+            return []
+        if len(self.labels) == 0:
+            return [Match("Unknown", None, float("inf"), float("inf")) for _ in face_encodings]
+
+        # Closest encoding of every person, for every face: F x P
+        per_person = np.minimum.reduceat(self.distances(face_encodings), self.group_starts, axis=1)
+        rows = np.arange(per_person.shape[0])
+
+        best = np.argmin(per_person, axis=1)
+        best_dist = per_person[rows, best]
+
+        if per_person.shape[1] > 1:
+            per_person[rows, best] = np.inf
+            margins = per_person.min(axis=1) - best_dist
+        else:
+            margins = np.full(len(best), np.inf)
+
+        matches = []
+        for index, distance, margin in zip(best, best_dist, margins):
+            label = self.names[index]
+            name = label if distance < self.tolerance else "Unknown"
+            matches.append(Match(name, label, float(distance), float(margin)))
+        return matches
@@ -0,0 +1,137 @@
+"""
+Declarative preprocessing of camera frames before detection and encoding.
+
+A profile is a list of (step, params) pairs run in order on every frame.
+Steps with "roi": True are not run on the whole frame but only on the face
+regions found by detection, right before encoding. Objects such as the
+CLAHE instance are built once per profile, and the frame is converted to
+the RGB the dlib models expect exactly once, at the end.
+
+Pick a profile per classroom with PREPROCESS_PROFILE in config.py and compare
+them with `python benchmark.py --preprocess <profile>`; the time of every
+step is reported as preprocess.<step>.
+"""
+import time
+
+import cv2
+import numpy as np
+
+from config import PREPROCESS_PROFILE
+
+PROFILES = {
+    # CLAHE on the gray frame plus a full-frame bilateral filter. Filtering a
+    # single channel with sigma_color 25 weighs pixels like sigma_color 75 on
+    # the three identical channels it used to run on.
+    "default": [("gray", {}),
+                ("clahe", {"clip_limit": 3.0, "tile": 8}),
+                ("bilateral", {"d": 9, "sigma_color": 25, "sigma_space": 75})],
+    # Same, with the bilateral filter only on the faces
+    "roi": [("gray", {}),
+            ("clahe", {"clip_limit": 3.0, "tile": 8}),
+            ("bilateral", {"d": 9, "sigma_color": 25, "sigma_space": 75, "roi": True})],
+    # Well lit rooms: light contrast equalization only
+    "bright": [("gray", {}),
+               ("clahe", {"clip_limit": 2.0, "tile": 8})],
+    # Dark rooms: brighten, equalize harder and denoise the faces
+    "dim": [("gray", {}),
+            ("gamma", {"gamma": 0.6}),
+            ("clahe", {"clip_limit": 4.0, "tile": 8}),
+            ("bilateral", {"d": 5, "sigma_color": 20, "sigma_space": 50, "roi": True})],
+    # Frames as captured
+    "color": [],
+}
+
+ROI_PADDING = 0.5  # margin around each face box, as a fraction of its size, that ROI steps filter
+
+
+def _gray(image):
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _make_clahe(clip_limit=3.0, tile=8):
+    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile, tile))
+    return clahe.apply
+
+
+def _make_gamma(gamma=1.0):
+    table = (255 * (np.arange(256) / 255) ** gamma).astype(np.uint8)
+    return lambda image: cv2.LUT(image, table)
+
+
+def _make_bilateral(d=9, sigma_color=75, sigma_space=75):
+    return lambda image: cv2.bilateralFilter(image, d=d, sigmaColor=sigma_color, sigmaSpace=sigma_space)
+
+
+# step name -> factory building the callable once from the step's params
+STEPS = {
+    "gray": lambda: _gray,
+    "clahe": _make_clahe,
+    "gamma": _make_gamma,
+    "bilateral": _make_bilateral,
+}
+
+
+class Preprocessor:
+    def __init__(self, steps):
+        self.frame_steps = []
+        self.roi_steps = []
+        for name, params in steps:
+            params = dict(params)
+            roi = params.pop("roi", False)
+            if name not in STEPS:
+                raise ValueError(f"Unknown preprocessing step '{name}'")
+            (self.roi_steps if roi else self.frame_steps).append((name, STEPS[name](**params)))
+        # Gray frames are returned as three identical channels
+        self.gray = any(name == "gray" for name, _ in self.frame_steps)
+
+    def apply(self, frame, timings=None, rgb=True):
+        """
+        Runs the frame steps on a BGR (or already gray) frame and returns it
+        as RGB. Without rgb, a gray result is returned as a single channel.
+        """
+        image = frame
+        for name, step in self.frame_steps:
+            t0 = time.perf_counter()
+            image = step(image)
+            _record(timings, name, time.perf_counter() - t0)
+        if not rgb and image.ndim == 2:
+            return image
+        code = cv2.COLOR_GRAY2RGB if image.ndim == 2 else cv2.COLOR_BGR2RGB
+        return cv2.cvtColor(image, code)
+
+    def apply_roi(self, rgb_frame, face_locations, timings=None, padding=ROI_PADDING):
+        """Runs the ROI steps on the padded face regions of an RGB frame, in place."""
+        if not self.roi_steps or not face_locations:
+            return rgb_frame
+        height, width = rgb_frame.shape[:2]
+        for top, right, bottom, left in face_locations:
+            pad_y = int((bottom - top) * padding)
+            pad_x = int((right - left) * padding)
+            region = rgb_frame[max(top - pad_y, 0):min(bottom + pad_y, height),
+                               max(left - pad_x, 0):min(right + pad_x, width)]
+            # Filter one channel of a gray frame and copy it back to all three
+            image = region[..., 0] if self.gray else region
+            for name, step in self.roi_steps:
+                t0 = time.perf_counter()
+                image = step(np.ascontiguousarray(image))
+                _record(timings, name, time.perf_counter() - t0)
+            region[...] = image[..., None] if self.gray else image
+        return rgb_frame
+
+
+def _record(timings, step, seconds):
+    if timings is not None:
+        timings.setdefault(f"preprocess.{step}", []).append(seconds)
+
+
+_preprocessors = {}
+
+
+def get_preprocessor(profile=None):
+    """Returns the (cached) Preprocessor of a profile name, PREPROCESS_PROFILE by default."""
+    profile = profile or PREPROCESS_PROFILE
+    if profile not in _preprocessors:
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown preprocessing profile '{profile}', choose one of {', '.join(PROFILES)}")
+        _preprocessors[profile] = Preprocessor(PROFILES[profile])
+    return _preprocessors[profile]
@@ -0,0 +1,105 @@
+"""
+Optional MJPEG preview of the recognizer, off the recognition hot path.
+
+The recognizer runs headless. When PREVIEW_ENABLED is set, fetch.py serves
+GET /preview as a multipart MJPEG stream. The recognizer only hands the
+newest processed frame and its boxes to publish(), which returns at once;
+annotation and JPEG encoding happen in a low-priority background thread.
+While no client is connected nothing is published at all, and when the
+encoder falls behind older frames are simply replaced by newer ones.
+"""
+import os
+import time
+import threading
+
+import cv2
+
+from config import PREVIEW_JPEG_QUALITY, PREVIEW_MAX_FPS, PREVIEW_NICE
+
+BOUNDARY = "frame"
+
+
+def annotate(frame, face_locations, labels):
+    """Draws every face box with its label onto frame, in place."""
+    for (top, right, bottom, left), label in zip(face_locations, labels):
+        cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+        cv2.putText(frame, label, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    return frame
+
+
+class PreviewStream:
+    def __init__(self, quality=None, max_fps=None):
+        self.quality = quality or PREVIEW_JPEG_QUALITY
+        self.min_interval = 1.0 / (max_fps or PREVIEW_MAX_FPS)
+        self.clients = 0
+        self.pending = None  # newest (frame, face_locations, labels) not encoded yet
+        self.jpeg = None
+        self.jpeg_seq = 0
+        self.last_publish = 0.0
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def active(self):
+        """True while somebody watches, so callers can skip fetching frames otherwise."""
+        return self.clients > 0
+
+    def publish(self, frame, face_locations, labels):
+        """Offers a BGR frame (owned by the preview from now on) to the stream. Never blocks on encoding."""
+        now = time.monotonic()
+        if not self.clients or now - self.last_publish < self.min_interval:
+            return
+        self.last_publish = now
+        with self.cond:
+            self.pending = (frame, list(face_locations), list(labels))
+            self.cond.notify_all()
+
+    def _start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._encode_loop, daemon=True)
+            self.thread.start()
+
+    def _encode_loop(self):
+        try:
+            # Linux lets a single thread lower its own priority
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREVIEW_NICE)
+        except (AttributeError, OSError):
+            pass
+
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending is not None)
+                frame, face_locations, labels = self.pending
+                self.pending = None
+
+            ok, buffer = cv2.imencode(".jpg", annotate(frame, face_locations, labels), params)
+            if not ok:
+                continue
+            with self.cond:
+                self.jpeg = buffer.tobytes()
+                self.jpeg_seq += 1
+                self.cond.notify_all()
+
+    def stream(self):
+        """Generator of multipart MJPEG chunks for one client."""
+        with self.cond:
+            self.clients += 1
+        self._start()
+        seen = 0
+        try:
+            while True:
+                with self.cond:
+                    if not self.cond.wait_for(lambda: self.jpeg_seq != seen, timeout=5):
+                        continue
+                    jpeg, seen = self.jpeg, self.jpeg_seq
+                yield (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n").encode() \
+                    + jpeg + b"\r\n"
+        finally:
+            with self.cond:
+                self.clients -= 1
+                if not self.clients:
+                    self.pending = None
+
+
+# Shared by the recognizer, which publishes, and the Flask app, which serves it
+preview_stream = PreviewStream()
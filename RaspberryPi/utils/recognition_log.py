@@ -0,0 +1,108 @@
+"""
+Append-only log of confirmed recognitions, one JSON object per line.
+
+    {"session": "...", "name": "...", "division": "A", "timestamp": 1713859200.0, "distance": 0.41}
+
+append() only adds a line to the file, so confirming a student costs the
+same at the end of a session as at its start. Every line is flushed to the
+OS at once, so a crash of the process loses nothing; a background thread
+fsyncs the file at most fsync_seconds after a line was appended, so a power
+cut loses at most those last seconds. read_records() streams the file line
+by line and skips a line cut short by a crash.
+"""
+import os
+import json
+import time
+import threading
+
+from config import RECOGNITION_LOG_PATH, RECOGNITION_LOG_FSYNC_SECONDS
+
+
+def read_records(path=None):
+    """Yields the records of a log file in the order they were written."""
+    try:
+        file = open(path or RECOGNITION_LOG_PATH, "r")
+    except FileNotFoundError:
+        return
+    with file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+class RecognitionLog:
+    def __init__(self, path=None, fsync_seconds=None):
+        self.path = path or RECOGNITION_LOG_PATH
+        self.fsync_seconds = RECOGNITION_LOG_FSYNC_SECONDS if fsync_seconds is None else fsync_seconds
+        self.file = None
+        self.last_sync = 0.0
+        self.dirty = False  # lines appended since the last fsync
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def append(self, record):
+        line = json.dumps(record) + "\n"
+        with self.cond:
+            if self.file is None:
+                self.file = open(self.path, "a")
+            self.file.write(line)
+            self.file.flush()
+            self.dirty = True
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._sync_loop, daemon=True)
+                self.thread.start()
+            self.cond.notify_all()
+
+    def _sync_loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.dirty)
+                # Batch the lines of the next fsync_seconds into one fsync
+                deadline = self.last_sync + self.fsync_seconds
+                while self.dirty and time.monotonic() < deadline:
+                    self.cond.wait(deadline - time.monotonic())
+                if not self.dirty or self.file is None:
+                    continue
+                # fsync a duplicate descriptor outside the lock, so append() never waits for the disk
+                fd = os.dup(self.file.fileno())
+                self.dirty = False
+                self.last_sync = time.monotonic()
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _sync(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.dirty = False
+        self.last_sync = time.monotonic()
+
+    def sync(self):
+        """Makes every appended record durable."""
+        with self.cond:
+            self._sync()
+
+    def read(self):
+        """Streams every record written so far, including buffered ones."""
+        self.sync()
+        return read_records(self.path)
+
+    def truncate(self):
+        """Empties the log, e.g. once its sessions are stored elsewhere."""
+        with self.cond:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.dirty = False
+            open(self.path, "w").close()
+
+    def close(self):
+        with self.cond:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
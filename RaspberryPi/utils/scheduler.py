@@ -0,0 +1,103 @@
+"""
+Decides which camera frames are worth running through recognition.
+
+Instead of processing every 5th frame, a frame is processed when
+
+  * enough time has passed since the last processed frame for the measured
+    processing cost to stay within cpu_budget of the available workers
+    (rolling mean over the last window frames), and
+  * the scene changed: the mean absolute difference between a small gray
+    thumbnail of the frame and that of the last processed frame is at least
+    motion_threshold, or max_interval seconds passed without processing.
+
+So static scenes are skipped almost entirely, and when students move frames
+are processed as fast as the budget allows.
+
+    scheduler = FrameScheduler()
+    if scheduler.should_process(frame):
+        start = time.perf_counter()
+        ...
+        scheduler.record(time.perf_counter() - start)
+"""
+import time
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+from config import SCHED_CPU_BUDGET, SCHED_MOTION_THRESHOLD, SCHED_MAX_INTERVAL, SCHED_WINDOW
+
+THUMBNAIL_SIZE = (64, 48)
+
+
+def thumbnail(frame):
+    """Small blurred gray copy of a BGR frame, cheap to compare."""
+    small = cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(small, (3, 3), 0)
+
+
+class FrameScheduler:
+    def __init__(self, cpu_budget=None, motion_threshold=None, max_interval=None, window=None, workers=1):
+        self.cpu_budget = cpu_budget or SCHED_CPU_BUDGET
+        self.motion_threshold = SCHED_MOTION_THRESHOLD if motion_threshold is None else motion_threshold
+        self.max_interval = max_interval or SCHED_MAX_INTERVAL
+        self.workers = workers  # frames that can be processed in parallel
+        self.costs = deque(maxlen=window or SCHED_WINDOW)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.last_time = None
+            self.last_thumbnail = None
+            self.last_motion = 0.0
+            self.skipped_static = 0
+            self.skipped_busy = 0
+
+    def record(self, seconds):
+        """Reports how long processing one frame took (summed over all stages)."""
+        with self.lock:
+            self.costs.append(seconds)
+
+    def interval(self):
+        """Shortest time between two processed frames that keeps within the CPU budget."""
+        with self.lock:
+            if not self.costs:
+                return 0.0
+            return sum(self.costs) / len(self.costs) / (self.cpu_budget * self.workers)
+
+    def motion(self, frame):
+        """Mean absolute difference (0-255) to the last processed frame."""
+        small = thumbnail(frame)
+        if self.last_thumbnail is None:
+            return float("inf"), small
+        return float(np.mean(cv2.absdiff(small, self.last_thumbnail))), small
+
+    def should_process(self, frame, now=None):
+        """Returns True if frame should be processed; it then becomes the new reference frame."""
+        now = time.monotonic() if now is None else now
+        if self.last_time is not None:
+            elapsed = now - self.last_time
+            if elapsed < self.interval():
+                self.skipped_busy += 1
+                return False
+        else:
+            elapsed = float("inf")
+
+        score, small = self.motion(frame)
+        if score < self.motion_threshold and elapsed < self.max_interval:
+            self.skipped_static += 1
+            return False
+
+        with self.lock:
+            self.last_time = now
+            self.last_thumbnail = small
+            self.last_motion = score
+        return True
+
+    def stats(self):
+        return {"interval": self.interval(), "motion": self.last_motion,
+                "skipped_static": self.skipped_static, "skipped_busy": self.skipped_busy}
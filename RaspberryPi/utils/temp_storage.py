@@ -1,93 +1,142 @@
 import json
 import atexit
+from time import perf_counter, time as wall_time  # send_data_to_mongodb has a parameter called time
 
-TEMP_FILE = "recognized_faces.json"
-from config import MONGO_URI, DATABASE_NAME, COLLECTION_NAME, COLLECTION_ENCODING
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import MONGO_URI, DATABASE_NAME, COLLECTION_NAME, COLLECTION_ENCODING, JOURNAL_FLUSH_TIMEOUT
 collection = COLLECTION_NAME # Placeholder for MongoDB collection
 from database.database import get_collection
+from database.encoding_store import load_names
+from database.journal import Journal, Replayer
+from database.sessions import session_id, write_session_document
+from database.aggregates import stats_field
+from utils.recognition_log import RecognitionLog
 
-def save_to_temp(name, division):
-    """Saves recognized name and division to a temporary file."""
-    try:
-        with open(TEMP_FILE, "r") as file:
-            recognized_faces = json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        recognized_faces = []
+DUPLICATE_KEY = 11000
+
+# Confirmed recognitions of the running session, until it is journaled
+recognition_log = RecognitionLog()
+atexit.register(recognition_log.close)
 
-    recognized_faces.append({
+
+def save_to_temp(name, division, session=None, distance=None):
+    """Appends a confirmed recognition to the recognition log."""
+    recognition_log.append({
+        "session": session,
         "name": name,
-        "division": division
+        "division": division,
+        "timestamp": wall_time(),
+        "distance": None if distance is None else float(distance),
     })
 
-    with open(TEMP_FILE, "w") as file:
-        json.dump(recognized_faces, file, indent=2)
-        
-import json
-def send_data_to_mongodb(collection, teacher, division, subject, date, time, semester):
-    try:
-        with open(TEMP_FILE, "r") as file:
-            recognized_faces = json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        recognized_faces = []
-    
-    try:
-        with open(f"encodings/{division}.json", "r") as file:
-            encodings_data = json.load(file)
-        all_students = list(encodings_data.keys())
-    except (FileNotFoundError, json.JSONDecodeError):
-        all_students = []
-    
-    filtered_faces = [face for face in recognized_faces if face.get("division") == division]
-    students_present = list({face["name"] for face in filtered_faces})
-    
-    db_collection = get_collection(collection)
-    
+def _student_update(field, entry, session, is_present):
+    """Appends the raw entry and, in the same atomic update, bumps the student's counters (database/aggregates.py)."""
+    stats = stats_field(session["semester"], session["subject"])
+    update = {
+        "$push": {field: {**entry, "status": "present" if is_present else "absent"}},
+        "$inc": {f"{stats}.held": 1, f"{stats}.attended": int(is_present)},
+    }
+    if is_present:
+        update["$max"] = {f"{stats}.last_seen": session["date"]}
+    return update
+
+
+def _merge_sessions(old, new):
+    """Same session recorded twice: whoever was present in either run was present."""
+    return {**new, "present": sorted(set(old["present"]) | set(new["present"])),
+            "students": sorted(set(old["students"]) | set(new["students"]))}
+
+
+def _write_session(key, session):
+    """Writes one journaled session to MongoDB; the replayer calls it until it succeeds."""
+    db_collection = get_collection(session["division"])
+    present = set(session["present"])
+
+    # One round trip for the whole session. The upsert creates the student
+    # document and the nested attendance.<semester>.<subject> array on first
+    # write, $push appends to them afterwards. Every update is conditional on
+    # the session key, so the whole write can be replayed at any time: the
+    # push skips students whose array already holds an entry of this session,
+    # and a student recorded absent by an earlier run of the same session who
+    # is present now has that entry flipped instead.
+    field = f"attendance.{session['semester']}.{session['subject']}"
+    stats = stats_field(session["semester"], session["subject"])
+    entry = {"teacher": session["teacher"], "date": session["date"], "time": session["time"], "session": key}
+    requests = []
+    for student in session["students"]:
+        requests.append(UpdateOne(
+            {"_id": student, f"{field}.session": {"$ne": key}},
+            _student_update(field, entry, session, student in present),
+            upsert=True,
+        ))
+        if student in present:
+            requests.append(UpdateOne(
+                {"_id": student, field: {"$elemMatch": {"session": key, "status": "absent"}}},
+                {"$set": {f"{field}.$.status": "present"},
+                 "$inc": {f"{stats}.attended": 1},
+                 "$max": {f"{stats}.last_seen": session["date"]}},
+            ))
+    if not requests:
+        return None
+
+    start = perf_counter()
     try:
-        with open(TEMP_FILE, "w") as file:
-            file.write("")
-        print("tempfile cleaned")
-            
-    except (FileNotFoundError, json.JSONDecodeError):
-        print("unable to open")
-    
-    for student in all_students:
-        status = "present" if student in students_present else "absent"
-        
-        # Check if student document exists
-        student_doc = db_collection.find_one({"_id": student})
-        
-        if not student_doc:
-            # Insert new document for student with _id as student name
-            db_collection.insert_one({
-                "_id": student,
-                "attendance": {
-                    semester: {
-                        subject: [
-                            {
-                                "teacher": teacher,
-                                "date": date,
-                                "time": time,
-                                "status": status
-                            }
-                        ]
-                    }
-                }
-            })
-        else:
-            # Update nested structure for existing student
-            update_query = {
-                f"attendance.{semester}.{subject}": {
-                    "$each": [{
-                        "teacher": teacher,
-                        "date": date,
-                        "time": time,
-                        "status": status
-                    }]
-                }
-            }
-            db_collection.update_one(
-                {"_id": student},
-                {"$push": update_query}
-            )
-    
-    print("Attendance updated successfully.")
+        result = db_collection.bulk_write(requests, ordered=False)
+        summary = {"matched": result.matched_count, "modified": result.modified_count,
+                   "upserted": result.upserted_count}
+    except BulkWriteError as e:
+        # An existing student whose entry is already there fails the filter and
+        # the upsert then collides with its _id: that student is done already
+        if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+            raise
+        summary = {"matched": e.details["nMatched"], "modified": e.details["nModified"],
+                   "upserted": e.details["nUpserted"]}
+    # Plus the compact per-session document that reports query
+    write_session_document(key, session)
+    summary["latency_ms"] = (perf_counter() - start) * 1000
+    print(f"Attendance of Division {session['division']} {session['subject']} {session['date']} written: "
+          f"{summary['matched']} matched, {summary['upserted']} upserted in {summary['latency_ms']:.0f} ms.")
+    return summary
+
+
+journal = Journal()
+replayer = Replayer(journal, _write_session)
+# Give sessions ended just before exit one chance to reach MongoDB, the rest
+# is replayed on the next start
+atexit.register(replayer.stop, JOURNAL_FLUSH_TIMEOUT)
+
+
+def start_replayer():
+    """Starts writing journaled sessions, including those left over from earlier runs."""
+    return replayer.start()
+
+
+def send_data_to_mongodb(teacher, division, subject, date, time, semester, session=None):
+    """
+    Commits the session to the local journal and returns its key at once;
+    the replayer writes it to MongoDB in the background. Without a session
+    id every logged recognition of the division counts.
+    """
+    students_present = list({record["name"] for record in recognition_log.read()
+                             if record.get("division") == division
+                             and (session is None or record.get("session") == session)})
+
+    all_students = load_names(division)
+
+    if not all_students:
+        print(f"No enrolled students for Division {division}, nothing to write.")
+        return None
+
+    key = session or session_id(teacher, division, subject, date, time)
+    journal.add(key, {"teacher": teacher, "division": division, "subject": subject, "date": date, "time": time,
+                      "semester": semester, "present": students_present, "students": list(all_students)},
+                merge=_merge_sessions)
+
+    # Only now that the session is durable the recognitions can go
+    recognition_log.truncate()
+
+    start_replayer().wake()
+    print(f"Session {key} journaled, writing it to MongoDB in the background.")
+    return key
@@ -0,0 +1,123 @@
+"""
+IoU face tracker, so a face that stays put is not encoded again every frame.
+
+Every detected box is assigned to the existing track it overlaps most (IoU
+above iou_threshold) or starts a new track. A face is sent to the encoder
+only when its track is new, was marked uncertain by the matcher, or its
+encoding is older than reencode_after seconds; otherwise the track's last
+encoding is reused. Tracks that go unseen for max_missed frames are dropped.
+
+    tracker = FaceTracker()
+    track_ids, needs_encoding = tracker.update(face_locations, timestamp)
+    for i in needs_encoding:
+        tracker.store(track_ids[i], encode(face_locations[i]), timestamp)
+    face_encodings = tracker.encodings(track_ids)
+"""
+import itertools
+
+import numpy as np
+
+from config import TRACK_IOU_THRESHOLD, TRACK_MAX_MISSED, TRACK_REENCODE_SECONDS, TRACK_MIN_MARGIN
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Intersection over union of every (top, right, bottom, left) box in boxes_a with every box in boxes_b."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(bottom - top, 0, None) * np.clip(right - left, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 1] - a[:, 3])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 1] - b[:, 3])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def is_uncertain(match, min_margin=None):
+    """A match worth re-encoding for: unknown, or barely closer than the runner-up person."""
+    return match.name == "Unknown" or match.margin < (min_margin or TRACK_MIN_MARGIN)
+
+
+class Track:
+    __slots__ = ("track_id", "box", "missed", "encoding", "encoded_at", "uncertain")
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.missed = 0
+        self.encoding = None
+        self.encoded_at = None
+        self.uncertain = False
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold=None, max_missed=None, reencode_after=None):
+        self.iou_threshold = iou_threshold or TRACK_IOU_THRESHOLD
+        self.max_missed = max_missed or TRACK_MAX_MISSED
+        self.reencode_after = reencode_after or TRACK_REENCODE_SECONDS
+        self.tracks = {}  # track id -> Track
+        self._ids = itertools.count(1)
+
+    def reset(self):
+        self.tracks.clear()
+
+    def update(self, face_locations, timestamp):
+        """
+        Assigns every box to a track. Returns (track_ids, needs_encoding):
+        one track id per box and the indexes of the boxes to encode.
+        """
+        face_locations = [tuple(box) for box in face_locations]
+        track_ids = [None] * len(face_locations)
+        tracks = list(self.tracks.values())
+
+        # Greedy assignment, best overlapping pairs first
+        if tracks and face_locations:
+            overlap = iou_matrix(face_locations, [track.box for track in tracks])
+            for flat in np.argsort(overlap, axis=None)[::-1]:
+                box_index, track_index = np.unravel_index(flat, overlap.shape)
+                if overlap[box_index, track_index] < self.iou_threshold:
+                    break
+                if track_ids[box_index] is not None or tracks[track_index] is None:
+                    continue
+                track = tracks[track_index]
+                track.box = face_locations[box_index]
+                track.missed = 0
+                track_ids[box_index] = track.track_id
+                tracks[track_index] = None
+
+        for track in tracks:
+            if track is not None:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    del self.tracks[track.track_id]
+
+        needs_encoding = []
+        for index, box in enumerate(face_locations):
+            if track_ids[index] is None:
+                track = Track(next(self._ids), box)
+                self.tracks[track.track_id] = track
+                track_ids[index] = track.track_id
+            else:
+                track = self.tracks[track_ids[index]]
+            if (track.encoding is None or track.uncertain
+                    or timestamp - track.encoded_at >= self.reencode_after):
+                needs_encoding.append(index)
+        return track_ids, needs_encoding
+
+    def store(self, track_id, encoding, timestamp):
+        track = self.tracks.get(track_id)
+        if track is not None:
+            track.encoding = encoding
+            track.encoded_at = timestamp
+            track.uncertain = False
+
+    def mark_uncertain(self, track_id):
+        """Makes the next update re-encode this track, e.g. because its match was weak."""
+        track = self.tracks.get(track_id)
+        if track is not None:
+            track.uncertain = True
+
+    def encodings(self, track_ids):
+        return [self.tracks[track_id].encoding for track_id in track_ids]
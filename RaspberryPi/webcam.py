@@ -8,14 +8,20 @@ import time
 import signal
 import sys
 
-from database.database import get_faces_from_local, get_collection
-from utils.temp_storage import save_to_temp, send_data_to_mongodb
+from enrollment import encode_division
+from utils.temp_storage import save_to_temp, send_data_to_mongodb, session_id
+from utils.matcher import FaceMatcher
+from utils.scheduler import FrameScheduler
+from utils.preview import preview_stream
+from config import PREVIEW_ENABLED
+from fetch import run_server
 
 DATASET_PATH = "./processed_dataset"
 ENCODINGS_PATH = "./encodings"
 
 latest_frame = None
 frame_lock = threading.Lock()
+frame_ready = threading.Event()  # set by the capture thread for every new frame
 
 
 def capture_frames():
@@ -38,6 +44,7 @@ def capture_frames():
 
         with frame_lock:
             latest_frame = rgb_frame
+        frame_ready.set()
 
     cap.release()
 
@@ -60,70 +67,19 @@ def preprocess_frame(frame):
 
 
 def encode_faces(division):
-    division_path = os.path.join(DATASET_PATH, division)
-    encoding_file = os.path.join(ENCODINGS_PATH, f"{division}.json")
-    os.makedirs(ENCODINGS_PATH, exist_ok=True)
-    limit = 10
-    count = 0
-
-    if not os.path.isdir(division_path):
-        print(f"❌ Division folder '{division}' not found.")
-        return
-
-    if os.path.exists(encoding_file):
-        with open(encoding_file, "r") as f:
-            existing_encodings = json.load(f)
-    else:
-        existing_encodings = {}
-
-    person_encodings = existing_encodings.copy()
-
-    for person_name in os.listdir(division_path):
-        if count > limit:
-            print(f"⚠️ Limit of {limit} persons exceeded.")
-            break
-
-        if person_name in existing_encodings:
-            print(f"⏭️ Skipping {person_name}, already encoded.")
-            continue
-
-        count += 1
-
-        person_path = os.path.join(division_path, person_name)
-        if not os.path.isdir(person_path):
-            continue
-
-        encodings = []
-        for img_name in os.listdir(person_path):
-            img_path = os.path.join(person_path, img_name)
-            image = face_recognition.load_image_file(img_path)
-            face_encs = face_recognition.face_encodings(image)
-            if face_encs:
-                encodings.append(face_encs[0].tolist())
-                print(f"✅ Encoded {img_name} for {person_name}")
-            else:
-                print(f"❌ No face found in {img_name}")
-
-        if encodings:
-            person_encodings[person_name] = encodings
-
-    with open(encoding_file, "w") as f:
-        json.dump(person_encodings, f, indent=2)
-    print(f"💾 Saved local encodings to {encoding_file}")
+    encode_division(division)
 
 
 def recognize_faces(teacher, division, subject, date, timing, semester):
-    known_faces = get_faces_from_local(division)
-    if not known_faces:
+    matcher = FaceMatcher.from_division(division)
+    if len(matcher) == 0:
         print(f"⚠️ No encodings found for Division {division}.")
         return
 
-    known_names = [face[0] for face in known_faces]
-    known_encodings = [np.array(face[1]) for face in known_faces]
-
-    framecount = 0
+    scheduler = FrameScheduler()
     recognition_count = {}
     confirmed_recognitions = set()
+    session = session_id(teacher, division, subject, date, timing)
 
     print("🧠 Starting recognition. Will run for 2 minutes or until Ctrl+C.")
 
@@ -136,69 +92,59 @@ def recognize_faces(teacher, division, subject, date, timing, semester):
                 print("⏰ Time limit reached. Stopping recognition.")
                 break
 
+            if not frame_ready.wait(timeout=0.1):
+                continue
+            frame_ready.clear()
             with frame_lock:
-                if latest_frame is None:
-                    continue
-                frame = latest_frame.copy()
+                frame = latest_frame
 
-            if framecount % 5 == 0:
-                enhanced_frame = preprocess_frame(frame)
-                rgb_frame = enhanced_frame  # already RGB
+            # Only frames with motion, as often as the measured processing cost allows
+            if not scheduler.should_process(frame):
+                continue
 
-                face_locations = face_recognition.face_locations(rgb_frame, model="hog")
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations, num_jitters=1)
+            start = time.perf_counter()
+            enhanced_frame = preprocess_frame(frame)
+            rgb_frame = enhanced_frame  # already RGB
 
-                current_frame_names = []
+            face_locations = face_recognition.face_locations(rgb_frame, model="hog")
+            face_encodings = face_recognition.face_encodings(rgb_frame, face_locations, num_jitters=1)
 
-                for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-                    face_distances = face_recognition.face_distance(known_encodings, face_encoding)
-                    best_match_index = np.argmin(face_distances)
-                    name = "Unknown"
+            current_frame_names = []
 
-                    if face_distances[best_match_index] < 0.5:
-                        name = known_names[best_match_index]
-                        recognition_count[name] = recognition_count.get(name, 0) + 1
+            matches = matcher.match(face_encodings)
 
-                        print(f"🎯 Matched: {name}, Count: {recognition_count[name]}, Distance: {face_distances[best_match_index]:.4f}")
+            for (top, right, bottom, left), match in zip(face_locations, matches):
+                name = match.name
 
-                        if recognition_count[name] >= 10 and name not in confirmed_recognitions:
-                            print(f"✅ Confirmed: {name} recognized consistently.")
-                            save_to_temp(name, division)
-                            confirmed_recognitions.add(name)
+                if name != "Unknown":
+                    recognition_count[name] = recognition_count.get(name, 0) + 1
 
-                    # Draw rectangle and name
-                    bgr_frame = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR)
-                    cv2.rectangle(bgr_frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                    cv2.putText(bgr_frame, f"{name} ({face_distances[best_match_index]:.2f})",
-                                (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                    cv2.imshow("Recognition", bgr_frame)
+                    print(f"🎯 Matched: {name}, Count: {recognition_count[name]}, Distance: {match.distance:.4f}")
 
-                    current_frame_names.append(name)
+                    if recognition_count[name] >= 10 and name not in confirmed_recognitions:
+                        print(f"✅ Confirmed: {name} recognized consistently.")
+                        save_to_temp(name, division, session, match.distance)
+                        confirmed_recognitions.add(name)
 
-                for registered_name in list(recognition_count.keys()):
-                    if registered_name not in current_frame_names:
-                        recognition_count[registered_name] = 0
+                current_frame_names.append(name)
 
-            framecount += 1
-            time.sleep(0.02)
+            for registered_name in list(recognition_count.keys()):
+                if registered_name not in current_frame_names:
+                    recognition_count[registered_name] = 0
 
-            if cv2.waitKey(1) & 0xFF == ord("q"):
-                print("❎ 'q' pressed. Exiting.")
-                break
+            # Headless; annotated and encoded off this loop while someone watches /preview
+            if preview_stream.active():
+                preview_stream.publish(cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR), face_locations,
+                                       [f"{match.name} ({match.distance:.2f})" for match in matches])
+
+            scheduler.record(time.perf_counter() - start)
 
     except KeyboardInterrupt:
         print("🛑 Ctrl+C pressed by user.")
 
     finally:
         print("☁️ Saving data to MongoDB...")
-        collection = get_collection(division)
-        send_data_to_mongodb(collection, teacher, division, subject, date, timing, semester)
-        cv2.destroyAllWindows()
-
-
-# Start capturing webcam frames
-camera_thread = threading.Thread(target=capture_frames, daemon=True)
-camera_thread.start()
+        send_data_to_mongodb(teacher, division, subject, date, timing, semester, session)
 
 
 def handle_data(data):
@@ -210,14 +156,18 @@ def handle_data(data):
     semester = data['semester']  # Ensure the frontend sends this
 
     encode_faces(division)
-    #if(flag_check):
     recognize_faces(teacher, division, subject, date, timing, semester)
-    #else:
-        #print("skipped recognize_faces due to limit of encoding exceed")
 
-#agar yaad aye to condition check kr lena nhi to hata dena
-#danger
 
+# Enrollment worker processes import this file, so nothing may run on import
+if __name__ == "__main__":
+    # Start capturing webcam frames
+    camera_thread = threading.Thread(target=capture_frames, daemon=True)
+    camera_thread.start()
+
+    # Serve the annotated /preview stream when it is enabled
+    if PREVIEW_ENABLED:
+        threading.Thread(target=run_server, daemon=True).start()
 
-data = {"teacherName":"ChandraPrakash", "division":"B", "subject":"CS232", "date":"2025-04-23", "time":"10 AM", "semester":"4"}
-handle_data(data)
+    data = {"teacherName":"ChandraPrakash", "division":"B", "subject":"CS232", "date":"2025-04-23", "time":"10 AM", "semester":"4"}
+    handle_data(data)
@@ -29,17 +29,10 @@ source bin/activate #set python virtual environment
 # Go to project directory
 cd <path/to/project/source/code>
 
-# Run your Python script and log output
+# Run the recognition service and log output. It stays up and handles
+# sessions back to back, keeping models and galleries loaded between them.
 python amain.py >> "$PYTHON_LOG" 2>&1
 
-#PYTHON_PID=$!
-echo "Started amain.py (PID $PYTHON_PID), logging to $PYTHON_LOG"
-
-# Let both processes run for 30 seconds
-sleep 120 #camera will run for 2 minutes(120 sec)
-
-# Kill both processes
+# amain.py only returns if the service stopped, take the tunnel down with it
 kill $CLOUDFLARED_PID
-
-#kill $PYTHON_PID
-echo "Stopped cloudflared and amain.py"
\ No newline at end of file
+echo "amain.py exited, stopped cloudflared"
\ No newline at end of file